@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+
+from wb_feed_spider.benchmark import LAZY_MODULES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_spider_import_does_not_load_lazy_modules():
+    code = (
+        "import json, sys\n"
+        "import wb_feed_spider.spider\n"
+        "print(json.dumps(sorted(sys.modules)))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True
+    )
+    assert proc.returncode == 0, proc.stderr
+    loaded = {name.split(".")[0] for name in json.loads(proc.stdout)}
+    assert not loaded & set(LAZY_MODULES)
@@ -0,0 +1,86 @@
+import json
+
+from wb_feed_spider.user import User
+from wb_feed_spider.weibo import Weibo
+from wb_feed_spider.writer.kafka_writer import KafkaWriter
+from wb_feed_spider.writer.memory_producer import MemoryProducer
+
+
+def make_weibo(weibo_id, user_id):
+    weibo = Weibo()
+    weibo.id = weibo_id
+    weibo.user_id = user_id
+    weibo.content = "内容" + weibo_id
+    return weibo
+
+
+def make_writer(producer, **config):
+    batches = []
+    config.setdefault("weibo_topics", ["weibo"])
+    config.setdefault("user_topics", ["user"])
+    writer = KafkaWriter(
+        config,
+        producer=producer,
+        on_batch=lambda kind, delivered, failed, seconds: batches.append(
+            (kind, delivered, failed)
+        ),
+    )
+    return writer, batches
+
+
+def test_messages_are_keyed_by_user_id():
+    producer = MemoryProducer()
+    writer, batches = make_writer(producer)
+    writer.write_weibo([make_weibo("A1", "100"), make_weibo("A2", "200")])
+    user = User()
+    user.id = "100"
+    user.nickname = "昵称"
+    writer.write_user(user)
+    writer.close()
+
+    weibos = producer.messages["weibo"]
+    assert [key for key, _ in weibos] == [b"100", b"200"]
+    payloads = [json.loads(value.decode("utf-8")) for _, value in weibos]
+    assert [p["id"] for p in payloads] == ["A1", "A2"]
+    assert payloads[0]["content"] == "内容A1"
+    key, value = producer.messages["user"][0]
+    assert key == b"100"
+    assert json.loads(value.decode("utf-8"))["nickname"] == "昵称"
+
+    assert batches == [("weibo", 2, 0), ("user", 1, 0)]
+    assert writer.stats["sent"] == 3
+    assert writer.stats["delivered"] == 3
+    assert writer.stats["failed"] == 0
+    assert writer.stats["batches"] == 2
+
+
+def test_failed_deliveries_are_counted():
+    producer = MemoryProducer(fail_topics=["weibo_backup"])
+    writer, batches = make_writer(producer, weibo_topics=["weibo", "weibo_backup"])
+    writer.write_weibo([make_weibo("A1", "100"), make_weibo("A2", "100")])
+
+    assert len(producer.messages["weibo"]) == 2
+    assert "weibo_backup" not in producer.messages
+    assert batches == [("weibo", 2, 2)]
+    assert writer.stats["delivered"] == 2
+    assert writer.stats["failed"] == 2
+
+
+def test_send_exceptions_release_in_flight_slots():
+    class BrokenProducer(MemoryProducer):
+        def send(self, topic, key=None, value=None):
+            raise RuntimeError("broker不可用")
+
+    writer, batches = make_writer(BrokenProducer(), max_in_flight=1)
+    writer.write_weibo([make_weibo("A1", "100"), make_weibo("A2", "100")])
+
+    assert batches == [("weibo", 0, 2)]
+    assert writer.stats["sent"] == 0
+    assert writer.stats["failed"] == 2
+
+
+def test_memory_bootstrap_server_uses_memory_producer():
+    writer = KafkaWriter({"bootstrap-server": "memory://", "weibo_topics": ["w"]})
+    writer.write_weibo([make_weibo("A1", "100")])
+    assert isinstance(writer.producer, MemoryProducer)
+    assert writer.producer.messages["w"][0][0] == b"100"
@@ -0,0 +1,72 @@
+import mongomock
+import pymongo
+import pytest
+
+from wb_feed_spider.user import User
+from wb_feed_spider.weibo import Weibo
+from wb_feed_spider.writer.mongo_writer import MongoWriter
+
+
+def make_weibo(weibo_id, content, up_num=0):
+    weibo = Weibo()
+    weibo.id = weibo_id
+    weibo.user_id = "1669879400"
+    weibo.content = content
+    weibo.publish_time = "2022-06-01 12:00"
+    weibo.up_num = up_num
+    return weibo
+
+
+def make_user(nickname, followers):
+    user = User()
+    user.id = "1669879400"
+    user.nickname = nickname
+    user.followers = followers
+    return user
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(pymongo, "MongoClient", lambda *args, **kwargs: client)
+    writer = MongoWriter({"connection_string": "mongodb://localhost:27017/"})
+    yield writer, client
+    writer.close()
+
+
+def test_write_weibo_upserts_by_id(writer):
+    writer, client = writer
+    writer.write_weibo([make_weibo("A1", "第一条"), make_weibo("A2", "第二条")])
+    writer.write_weibo([make_weibo("A2", "第二条(编辑)", up_num=5), make_weibo("A3", "第三条")])
+
+    collection = client["weibo"]["weibo"]
+    docs = {doc["id"]: doc for doc in collection.find({}, {"_id": False})}
+    assert sorted(docs) == ["A1", "A2", "A3"]
+    assert docs["A1"]["content"] == "第一条"
+    assert docs["A2"]["content"] == "第二条(编辑)"
+    assert docs["A2"]["up_num"] == 5
+    assert collection.count_documents({"id": "A2"}) == 1
+
+
+def test_write_user_upserts_by_id(writer):
+    writer, client = writer
+    writer.write_user(make_user("旧昵称", 10))
+    writer.write_user(make_user("新昵称", 20))
+
+    collection = client["weibo"]["user"]
+    assert collection.count_documents({}) == 1
+    doc = collection.find_one({"id": "1669879400"})
+    assert doc["nickname"] == "新昵称"
+    assert doc["followers"] == 20
+
+
+def test_unique_index_on_id(writer):
+    writer, client = writer
+    writer.write_weibo([make_weibo("A1", "第一条")])
+    writer.write_user(make_user("昵称", 1))
+
+    for name in ("weibo", "user"):
+        indexes = client["weibo"][name].index_information()
+        id_indexes = [v for v in indexes.values() if v["key"] == [("id", 1)]]
+        assert len(id_indexes) == 1
+        assert id_indexes[0].get("unique") is True
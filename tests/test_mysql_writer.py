@@ -0,0 +1,146 @@
+import threading
+
+import pymysql
+import pytest
+
+from wb_feed_spider.weibo import Weibo
+from wb_feed_spider.writer.mysql_writer import MySqlWriter
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.max_stmt_length = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql):
+        pass
+
+    def fetchone(self):
+        return (4 * 1024 * 1024,)
+
+    def executemany(self, sql, rows):
+        server = self.connection.server
+        if self.connection.database is None:
+            raise pymysql.OperationalError(1046, "No database selected")
+        if server.before_write:
+            server.before_write.pop(0)(self.connection)
+        server.rows.extend(rows)
+
+
+class FakeConnection:
+    def __init__(self, server, database=None, **kwargs):
+        self.server = server
+        self.database = database
+        self.dead = False
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def select_db(self, database):
+        self.database = database
+
+    def ping(self, reconnect=False):
+        if self.dead:
+            raise pymysql.OperationalError(2013, "Lost connection")
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeServer:
+    def __init__(self):
+        self.connections = []
+        self.rows = []
+        self.before_write = []  # 依次在写入前调用，可以阻塞或抛出异常
+
+    def connect(self, **kwargs):
+        connection = FakeConnection(self, **kwargs)
+        self.connections.append(connection)
+        return connection
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(pymysql, "connect", server.connect)
+    return server
+
+
+def make_weibo(weibo_id):
+    weibo = Weibo()
+    weibo.id = weibo_id
+    return weibo
+
+
+def test_pooled_connections_select_database(server):
+    writer = MySqlWriter({"host": "localhost", "pool_size": 1})
+    writer.write_weibo([make_weibo("A1")])
+    assert server.connections[0].closed  # 建表用的临时连接
+    assert server.connections[1].database == "weibo"
+    assert [row[0] for row in server.rows] == ["A1"]
+
+
+def test_dead_connection_is_replaced(server):
+    writer = MySqlWriter({"host": "localhost", "pool_size": 1})
+    writer.write_weibo([make_weibo("A1")])
+    server.connections[-1].dead = True
+    writer.write_weibo([make_weibo("A2")])
+    assert len(server.connections) == 3
+    assert server.connections[-1].database == "weibo"
+    assert [row[0] for row in server.rows] == ["A1", "A2"]
+
+
+def test_write_errors_are_raised(server):
+    writer = MySqlWriter({"host": "localhost"})
+
+    def fail(connection):
+        raise pymysql.OperationalError(2013, "Lost connection")
+
+    server.before_write.append(fail)
+    with pytest.raises(pymysql.MySQLError):
+        writer.write_weibo([make_weibo("A1")])
+
+
+def test_waiters_wake_up_when_a_connection_is_dropped(server):
+    writer = MySqlWriter({"host": "localhost", "pool_size": 1})
+    writing = threading.Event()
+    release = threading.Event()
+
+    def fail_after_release(connection):
+        writing.set()
+        release.wait(5)
+        raise pymysql.OperationalError(2013, "Lost connection")
+
+    server.before_write.append(fail_after_release)
+    errors = []
+
+    def write(weibo_id):
+        try:
+            writer.write_weibo([make_weibo(weibo_id)])
+        except pymysql.MySQLError as e:
+            errors.append(e)
+
+    first = threading.Thread(target=write, args=("A1",), daemon=True)
+    first.start()
+    writing.wait(5)
+    second = threading.Thread(target=write, args=("A2",), daemon=True)
+    second.start()
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert not second.is_alive()
+    assert len(errors) == 1
+    assert [row[0] for row in server.rows] == ["A2"]
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime
+
+from lxml import etree
+
+from wb_feed_spider import http_util
+from wb_feed_spider.parser import page_parser
+from wb_feed_spider.parser.page_parser import PageParser
+from wb_feed_spider.weibo import Weibo
+
+
+def test_empty_page_stops_paging(monkeypatch):
+    fetches = []
+
+    def fetch_html(cookie, url, parse_unchanged=True):
+        fetches.append(url)
+        return etree.HTML("<html><body><div class='c'>pager</div></body></html>"), True
+
+    monkeypatch.setattr(page_parser, "fetch_html", fetch_html)
+    monkeypatch.setattr(http_util, "penalize", lambda url: None)
+    parser = PageParser("cookie", 0, datetime.now(), page=2)
+    assert len(fetches) == 3  # 空页面重试两次
+    assert parser.to_continue is False
+    assert parser.get_one_page(set())[2] is False
+
+
+def test_missing_page_stops_paging(monkeypatch):
+    monkeypatch.setattr(page_parser, "fetch_html", lambda *args, **kwargs: (None, True))
+    monkeypatch.setattr(http_util, "penalize", lambda url: None)
+    parser = PageParser("cookie", 0, datetime.now(), page=4)
+    assert parser.to_continue is False
+    assert parser.get_one_page(set())[0] == []
+
+
+def test_queued_enrichment_tasks_are_not_timed_out(monkeypatch):
+    page_parser.configure_enrichment({"workers": 1, "timeout": 0.2})
+
+    def apply_enrichment(self, weibo, fields):
+        weibo.content = fields["content"]
+
+    monkeypatch.setattr(PageParser, "apply_enrichment", apply_enrichment)
+    parser = PageParser.__new__(PageParser)
+
+    def slow_task():
+        time.sleep(0.15)
+        return {"content": "全文"}
+
+    # 单线程依次执行，后面的任务排队超过0.2秒，但各自只执行0.15秒
+    parsed = []
+    for i in range(3):
+        weibo = Weibo()
+        weibo.id = "A%d" % i
+        parsed.append((weibo, [slow_task]))
+    try:
+        weibos = parser.enrich_weibos(parsed)
+    finally:
+        page_parser.configure_enrichment({"workers": 4, "timeout": 30})
+    assert [w.content for w in weibos] == ["全文"] * 3
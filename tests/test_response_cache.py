@@ -0,0 +1,55 @@
+import requests
+
+from wb_feed_spider.response_cache import ResponseCache
+
+FEED_PAGE = b'<html><body><div class="c" id="M_1">weibo</div></body></html>'
+COMMENT_URL = "https://weibo.cn/comment/%s"
+
+
+class FakeSession:
+    """按url返回预设的响应体，记录请求次数"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = 0
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests += 1
+        resp = requests.Response()
+        resp.url = url
+        resp.status_code = 200
+        resp._content = self.pages[url]
+        return resp
+
+
+def test_caches_normal_pages():
+    url = COMMENT_URL % "A1"
+    session = FakeSession({url: FEED_PAGE})
+    cache = ResponseCache()
+    assert cache.fetch(session, url, {})[0] == FEED_PAGE
+    assert cache.fetch(session, url, {})[0] == FEED_PAGE
+    assert session.requests == 1
+
+
+def test_does_not_cache_anti_crawl_pages():
+    url = COMMENT_URL % "A1"
+    session = FakeSession({url: "<html><body>请求过于频繁</body></html>".encode("utf8")})
+    cache = ResponseCache()
+    cache.fetch(session, url, {})
+    session.pages[url] = FEED_PAGE
+    assert cache.fetch(session, url, {})[0] == FEED_PAGE
+    assert session.requests == 2
+
+
+def test_byte_budget_evicts_least_recently_used():
+    urls = [COMMENT_URL % i for i in range(3)]
+    session = FakeSession({url: FEED_PAGE for url in urls})
+    cache = ResponseCache(max_bytes=2 * len(FEED_PAGE))
+    for url in urls:
+        cache.fetch(session, url, {})
+    assert session.requests == 3
+
+    cache.fetch(session, urls[2], {})
+    assert session.requests == 3
+    cache.fetch(session, urls[0], {})
+    assert session.requests == 4
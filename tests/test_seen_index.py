@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from wb_feed_spider.seen_index import SeenIndex
+
+
+def test_pending_ids_are_not_persisted(tmp_path):
+    path = str(tmp_path / "seen_index.db")
+    seen = SeenIndex(path)
+    seen.start_refresh()
+    seen.add_pending("A1")
+    seen.add_pending("A2")
+    seen.add("A1")
+    assert "A1" in seen and "A2" in seen
+    assert not seen.seen_before_refresh("A2")
+    seen.close()
+
+    seen = SeenIndex(path)
+    assert "A1" in seen
+    assert "A2" not in seen
+    seen.close()
+
+
+def test_unwritten_ids_are_retried_next_refresh(tmp_path):
+    seen = SeenIndex(str(tmp_path / "seen_index.db"))
+    seen.start_refresh()
+    seen.add_pending("A1", datetime(2022, 6, 1, 12, 0))
+    seen.add_pending("A2", datetime(2022, 6, 1, 12, 5))
+    seen.add("A2")
+    assert seen.oldest_pending() == datetime(2022, 6, 1, 12, 0)
+
+    seen.start_refresh()
+    assert "A1" not in seen
+    assert seen.retrying()
+    # A1重新出现之前，已写入的A2不作为翻页的边界
+    assert not seen.seen_before_refresh("A2")
+    seen.add_pending("A1", datetime(2022, 6, 1, 12, 0))
+    assert not seen.retrying()
+    assert seen.seen_before_refresh("A2")
+    seen.close()
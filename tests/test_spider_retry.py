@@ -0,0 +1,99 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from wb_feed_spider import http_util
+from wb_feed_spider.parser.util import ReplayAdapter, hash_url
+from wb_feed_spider.spider import Spider
+
+CONFIG_SAMPLE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "wb_feed_spider", "config_sample.json"
+)
+
+
+def feed_item(weibo_id, minutes):
+    return (
+        '<div class="c" id="M_%s"><div><a class="nk" href="https://weibo.cn/u/100">U100</a>'
+        '<span class="ctt">:内容%s</span></div><div><a href="https://weibo.cn/attitude/%s">赞[1]</a> '
+        '<a href="https://weibo.cn/repost/%s">转发[2]</a> '
+        '<a class="cc" href="https://weibo.cn/comment/%s">评论[3]</a> '
+        '<span class="ct">%d分钟前 来自iPhone</span></div></div>'
+    ) % (weibo_id, weibo_id, weibo_id, weibo_id, weibo_id, minutes)
+
+
+PAGES = {
+    "https://weibo.cn/": '<html><head><meta charset="utf-8"/></head><body>%s%s'
+    '<div class="c">pager</div></body></html>'
+    % (feed_item("A1", 10), feed_item("A2", 20)),
+    "https://weibo.cn/100": '<html><head><meta charset="utf-8"/></head><body>'
+    '<div class="u"><a href="/100/info">资料</a></div><div class="tip2">'
+    "<span>微博[12]</span><a>关注[3]</a><a>粉丝[45]</a></div></body></html>",
+    "https://weibo.cn/100/info": '<html><head><meta charset="utf-8"/>'
+    "<title>U100的资料</title></head><body><div class=\"c\">a</div>"
+    '<div class="c">b</div><div class="c">性别:男<br/>地区:北京</div></body></html>',
+}
+
+
+class FlakyWriter:
+    """第一次write_weibo失败，之后正常写入"""
+
+    def __init__(self):
+        self.failures = 1
+        self.weibo_ids = []
+
+    def write_weibo(self, weibos):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("写入失败")
+        self.weibo_ids.extend(w.id for w in weibos)
+
+    def write_user(self, user):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def spider(tmp_path):
+    data_dir = tmp_path / "testdata"
+    data_dir.mkdir()
+    for url, body in PAGES.items():
+        (data_dir / ("%s.html" % hash_url(url))).write_text(body, encoding="utf-8")
+    with open(CONFIG_SAMPLE, encoding="utf-8") as f:
+        config = json.load(f)
+    config.update(
+        cookie="test",
+        filter=0,
+        write_mode=[],
+        max_page=1,
+        http_config={"rate_limit": 0},
+        user_cache={"path": str(tmp_path / "user_cache.db")},
+        seen_index={"path": str(tmp_path / "seen_index.db")},
+    )
+    spider = Spider(config)
+    http_util.set_transport(ReplayAdapter(str(data_dir)))
+    spider.writers = [FlakyWriter()]
+    yield spider
+    spider.close()
+    http_util.set_transport(None)
+
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_failed_write_is_retried_next_refresh(spider, async_mode):
+    refresh = spider.run_async if async_mode else spider.get_feed
+    spider.since_time = datetime.now() - timedelta(hours=1)
+    refresh()
+    assert len(spider.writers[0].weibo_ids) < 2
+
+    spider.next_refresh()
+    assert spider.since_time <= datetime.now() - timedelta(minutes=9)
+    refresh()
+    assert sorted(spider.writers[0].weibo_ids) == ["A1", "A2"]
+    assert "A1" in spider.seen_index and "A2" in spider.seen_index
+
+    spider.next_refresh()
+    refresh()
+    assert sorted(spider.writers[0].weibo_ids) == ["A1", "A2"]
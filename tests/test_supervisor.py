@@ -0,0 +1,95 @@
+import json
+import os
+import sqlite3
+import time
+
+import pytest
+
+from wb_feed_spider import config_util, http_util, response_cache
+from wb_feed_spider.supervisor import Claims, LeaseStore, Worker, account_config
+
+CONFIG_SAMPLE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "wb_feed_spider", "config_sample.json"
+)
+
+
+def test_unconfirmed_weibo_claims_expire(tmp_path):
+    store = LeaseStore(str(tmp_path / "lease.db"))
+    a = Claims(store, "a", weibo_ttl=0.05)
+    b = Claims(store, "b", weibo_ttl=0.05)
+    assert a.claim("weibo", "A1")
+    assert not b.claim("weibo", "A1")
+    assert a.claim("weibo", "A1")
+    time.sleep(0.1)
+    assert b.claim("weibo", "A1")
+    store.close()
+
+
+def test_confirmed_weibo_claims_do_not_expire(tmp_path):
+    store = LeaseStore(str(tmp_path / "lease.db"))
+    a = Claims(store, "a", weibo_ttl=0.05)
+    b = Claims(store, "b", weibo_ttl=0.05)
+    assert a.claim("weibo", "A1")
+    a.confirm("weibo", ["A1"])
+    time.sleep(0.1)
+    assert not b.claim("weibo", "A1")
+    assert not a.claim("weibo", "A1")
+    store.close()
+
+
+def test_adds_done_column_to_old_claim_table(tmp_path):
+    path = str(tmp_path / "lease.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE claim (kind TEXT NOT NULL, key TEXT NOT NULL, "
+        "owner TEXT NOT NULL, claimed_at REAL NOT NULL, PRIMARY KEY (kind, key))"
+    )
+    conn.execute("INSERT INTO claim VALUES ('weibo', 'A1', 'a', ?)", (time.time(),))
+    conn.commit()
+    conn.close()
+
+    store = LeaseStore(path)
+    claims = Claims(store, "b")
+    assert not claims.claim("weibo", "A1")
+    assert claims.claim("weibo", "A2")
+    assert store._conn.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+    store.close()
+
+
+def make_config(tmp_path, accounts):
+    with open(CONFIG_SAMPLE, encoding="utf-8") as f:
+        config = json.load(f)
+    config.update(
+        write_mode=[],
+        accounts=accounts,
+        supervisor={"lease_path": str(tmp_path / "lease.db")},
+    )
+    return config
+
+
+def test_accounts_cannot_override_process_config(tmp_path):
+    config = make_config(
+        tmp_path, [{"name": "a", "cookie": "c", "http_config": {"rate_limit": 5}}]
+    )
+    with pytest.raises(SystemExit):
+        config_util.validate_config(config)
+    merged = account_config(config, config["accounts"][0])
+    assert merged.get("http_config") == config.get("http_config")
+
+
+def test_taking_over_an_account_keeps_shared_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = make_config(
+        tmp_path, [{"name": "a", "cookie": "ca"}, {"name": "b", "cookie": "cb"}]
+    )
+    worker = Worker(config, 0, 2)
+    cache, session = response_cache.get_cache(), http_util.get_session()
+    try:
+        for account in config["accounts"]:
+            worker.spiders[account["name"]] = worker._start_spider(account)
+        assert response_cache.get_cache() is cache
+        assert http_util.get_session() is session
+    finally:
+        for name in list(worker.spiders):
+            worker._stop_spider(name)
+        worker.store.close()
@@ -0,0 +1,56 @@
+import sys
+
+import pytest
+
+from wb_feed_spider import write_queue
+from wb_feed_spider.write_queue import WriteBehindQueue
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(write_queue, "_POLL_INTERVAL", 0.01)
+
+
+def test_writer_exception_only_drops_its_batch():
+    written = []
+
+    def write_weibo(batch):
+        if "bad" in batch:
+            raise RuntimeError("写入失败")
+        written.extend(batch)
+
+    q = WriteBehindQueue(write_weibo, lambda user: None, batch_size=2)
+    q.put_weibos(["a", "bad"])
+    q.put_weibos(["c", "d"])
+    q.flush()
+    q.put_weibos(["e"])
+    q.close()
+    assert written == ["c", "d", "e"]
+
+
+def test_writer_exit_is_raised_on_caller_thread():
+    def write_weibo(batch):
+        sys.exit()
+
+    q = WriteBehindQueue(write_weibo, lambda user: None, batch_size=2, max_pending=2)
+    q.put_weibos(["a", "b"])
+    with pytest.raises(SystemExit):
+        # 后台线程退出后队列很快被填满，put不能一直阻塞
+        for _ in range(10):
+            q.put_weibos(["c"])
+    with pytest.raises(SystemExit):
+        q.flush()
+    with pytest.raises(SystemExit):
+        q.close()
+
+
+def test_flush_raises_when_writer_exits_mid_flush():
+    def write_weibo(batch):
+        raise SystemExit(1)
+
+    q = WriteBehindQueue(write_weibo, lambda user: None, batch_size=10)
+    q.put_weibos(["a"])
+    with pytest.raises(SystemExit):
+        q.flush()
+    with pytest.raises(SystemExit):
+        q.close()
@@ -1,8 +1,3 @@
-import os
-import sys
-
-sys.path.append(os.path.abspath(os.path.dirname(os.getcwd())))
-
-from wb_feed_spider.spider import main
+from .spider import main
 
 main()
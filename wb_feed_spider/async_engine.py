@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from . import metrics
+
+logger = logging.getLogger("spider.async_engine")
+
+
+class AsyncEngine:
+    """异步刷新引擎
+
+    每条微博的子请求(长微博、组图、视频链接)、作者信息以及写入/下载作为独立任务并发执行，
+    所有阻塞调用都在全局并发上限内的线程池中运行，各host的限速由http_util负责。
+    """
+
+    def __init__(self, spider, concurrency=8):
+        self.spider = spider
+        self.concurrency = concurrency
+
+    async def _run(self, func, *args):
+        """在线程池中执行阻塞调用，受全局并发上限约束"""
+        async with self._semaphore:
+            return await self._loop.run_in_executor(
+                self._executor, partial(func, *args)
+            )
+
+    async def _write(self, index, method, arg):
+        """同一个writer的写入按顺序进行，不同writer之间并发"""
+        writer = self.spider.writers[index]
+        async with self._writer_locks[index]:
+            write = metrics.timed(
+                "write", writer=type(writer).__name__, kind=method[len("write_") :]
+            )(getattr(writer, method))
+            await self._run(write, arg)
+
+    async def _fetch_user(self, user_id):
+        user = await self._run(self.spider.get_user_info, user_id)
+        if user:
+            await asyncio.gather(
+                *(
+                    self._write(i, "write_user", user)
+                    for i in range(len(self.spider.writers))
+                )
+            )
+            await self._run(self.spider.user_cache.put, user)
+
+    async def _ensure_user(self, user_id):
+        """同一作者只抓取一次，并发的微博共享同一个任务"""
+        task = self._user_tasks.get(user_id)
+        if task is None:
+            if not await self._run(self.spider.need_user, user_id):
+                return
+            task = self._user_tasks.get(user_id)
+            if task is None:
+                task = asyncio.ensure_future(self._fetch_user(user_id))
+                self._user_tasks[user_id] = task
+        await task
+
+    async def _handle_item(self, page_parser, item):
+        """获取一条微博的完整信息并写入"""
+        try:
+            if not await self._run(self.spider.claim, "weibo", item.id):
+                self.spider.seen_index.discard_pending(item.id)
+                return 0
+            weibo = await self._run(page_parser.get_one_weibo, item)
+            if not weibo:
+                return 0
+            await self._ensure_user(weibo.user_id)
+            await asyncio.gather(
+                *(
+                    self._write(i, "write_weibo", [weibo])
+                    for i in range(len(self.spider.writers))
+                ),
+                *(
+                    self._run(downloader.download_files, [weibo])
+                    for downloader in self.spider.downloaders
+                )
+            )
+            await self._run(self.spider._mark_written, [weibo])
+            return 1
+        except Exception as e:
+            logger.exception(e)
+            return 0
+
+    async def get_feed(self):
+        """异步完成一次刷新，返回本次爬取的微博数"""
+        spider = self.spider
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._writer_locks = [asyncio.Lock() for _ in spider.writers]
+        self._user_tasks = {}
+        page_tasks = {}
+        item_tasks = []
+        try:
+            for page in range(1, spider.max_page + 1):
+                last = min(page + spider.page_prefetch, spider.max_page)
+                for p in range(page, last + 1):
+                    if p not in page_tasks:
+                        page_tasks[p] = asyncio.ensure_future(
+                            self._run(spider._fetch_page, p)
+                        )
+                page_parser = await page_tasks.pop(page)
+
+                # 流式解析时这里还要读取页面的剩余部分，放到线程池中执行
+                items, to_continue = await self._run(
+                    page_parser.select_new_items, spider.seen_index
+                )
+                if page == 1:
+                    # 内容未变的第一页同样算作没有新微博
+                    page_size = 1 if page_parser.unchanged else page_parser.item_count
+                    spider.first_page_new = (len(items), page_size)
+                for item in items:
+                    item_tasks.append(
+                        asyncio.ensure_future(self._handle_item(page_parser, item))
+                    )
+                if not to_continue:
+                    break
+
+            return sum(await asyncio.gather(*item_tasks))
+        finally:
+            for task in page_tasks.values():
+                task.cancel()
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,469 @@
+"""离线回放基准测试
+
+用 parser/util.py 中 GENERATE_TEST_DATA 录制的页面代替网络请求，
+测量各解析器以及完整 Spider.get_feed 刷新的吞吐、单条耗时与峰值内存，不访问网络。
+
+    python -m wb_feed_spider.benchmark --data tests/testdata --rounds 5
+    python -m wb_feed_spider.benchmark --xpaths
+    python -m wb_feed_spider.benchmark --stream 500
+    python -m wb_feed_spider.benchmark --writers 10000 [--mongo mongodb://localhost:27017]
+        [--mysql '{"host": "127.0.0.1", "port": 3306, "user": "root", "password": "123456"}']
+    python -m wb_feed_spider.benchmark --importtime [BUDGET_MS]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from lxml import etree
+
+from . import http_util, response_cache
+from .parser import IndexParser, PageParser
+from .parser import configure_streaming, xpaths
+from .parser.comment_parser import CommentParser
+from .parser.util import TEST_DATA_DIR, URL_MAP_FILE, ReplayAdapter, hash_url
+from .spider import Spider
+from .weibo import Weibo
+from .writer import MongoWriter, MySqlWriter, SqliteWriter
+
+FEED_URL = "https://weibo.cn/"
+FEED_PATTERN = re.compile(r"^https://weibo\.cn/(\?page=(\d+))?$")
+COMMENT_PATTERN = re.compile(r"^https://weibo\.cn/comment/([^/?]+)$")
+INFO_PATTERN = re.compile(r"^https://weibo\.cn/([^/?]+)/info$")
+COOKIE = "replay"
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+# 启动时不应导入的模块，只在配置的写入方式、下载或异步引擎用到时才导入
+LAZY_MODULES = ("lxml", "tqdm", "pymongo", "pymysql", "kafka", "asyncio")
+# 回放时不限速
+NO_RATE_LIMIT = {"rate_limit": 0, "hosts": {"weibo.cn": {"rate_limit": 0}}}
+
+
+class Result:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.total = 0.0
+        self.peak_memory = 0
+
+    def report(self):
+        n = len(self.latencies)
+        if not n:
+            return "%-12s 没有可回放的数据" % self.name
+        ordered = sorted(self.latencies)
+        p50 = statistics.median(ordered)
+        p99 = ordered[min(n - 1, int(n * 0.99))]
+        return "%-12s %6d条  %9.1f条/秒  p50 %8.3fms  p99 %8.3fms  峰值内存 %7.1fKiB" % (
+            self.name,
+            n,
+            n / self.total if self.total else 0,
+            p50 * 1000,
+            p99 * 1000,
+            self.peak_memory / 1024,
+        )
+
+
+def load_url_map(data_dir):
+    with open(os.path.join(data_dir, URL_MAP_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def measure(name, rounds, setup, run_one):
+    """setup()返回待处理的条目列表，run_one(item)处理一条；
+    计时轮次不开启tracemalloc，最后单独跑一轮测量峰值内存"""
+    result = Result(name)
+    for _ in range(rounds):
+        for item in setup():
+            start = time.perf_counter()
+            run_one(item)
+            elapsed = time.perf_counter() - start
+            result.latencies.append(elapsed)
+            result.total += elapsed
+
+    tracemalloc.start()
+    for item in setup():
+        run_one(item)
+    result.peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def bench_page_parser(url_map, rounds):
+    """单条微博的解析，长微博、组图与视频链接的子请求同样从录制数据回放"""
+    pages = sorted(
+        int(m.group(2) or 1) for m in map(FEED_PATTERN.match, url_map) if m
+    )
+
+    def setup():
+        items = []
+        for page in pages:
+            parser = PageParser(COOKIE, 0, datetime(1970, 1, 1), page)
+            items.extend((parser, item) for item in parser.get_feed_items())
+        return items
+
+    return measure(
+        "PageParser", rounds, setup, lambda args: args[0].get_one_weibo(args[1])
+    )
+
+
+def bench_comment_parser(url_map, rounds):
+    weibo_ids = [m.group(1) for m in map(COMMENT_PATTERN.match, url_map) if m]
+    return measure(
+        "CommentParser",
+        rounds,
+        lambda: weibo_ids,
+        lambda weibo_id: CommentParser(COOKIE, weibo_id).get_long_weibo(),
+    )
+
+
+def bench_user_parser(url_map, rounds):
+    """IndexParser与其调用的InfoParser"""
+    user_ids = [
+        m.group(1)
+        for m in map(INFO_PATTERN.match, url_map)
+        if m and "https://weibo.cn/" + m.group(1) in url_map
+    ]
+    return measure(
+        "IndexParser",
+        rounds,
+        lambda: user_ids,
+        lambda user_id: IndexParser(COOKIE, user_id).get_user(),
+    )
+
+
+def bench_get_feed(url_map, rounds, max_page):
+    """完整的一次刷新，每条记录是一轮刷新"""
+    config = {
+        "cookie": COOKIE,
+        "filter": 0,
+        "refresh_interval": 0,
+        "max_page": max_page,
+        "write_mode": [],
+        "pic_download": 0,
+        "video_download": 0,
+        "user_cache": {"path": ":memory:"},
+        "seen_index": {"path": ":memory:"},
+        "response_cache": {"enabled": 0},
+        "http_config": NO_RATE_LIMIT,
+    }
+    got = []
+
+    def run_one(_):
+        spider = Spider(config)
+        spider.since_time = datetime(1970, 1, 1)
+        spider.get_feed()
+        got.append(spider.got_num)
+        spider.close()
+
+    result = measure("get_feed", rounds, lambda: [None], run_one)
+    result.name = "get_feed(%d条/轮)" % (got[0] if got else 0)
+    return result
+
+
+def bench_xpaths(data_dir, url_map, rounds):
+    """在录制的页面上比较 element.xpath("...") 与xpaths中预编译的XPath的单次调用耗时，
+    以//或body开头的表达式作用于整个页面，其余作用于页面中的每个div.c"""
+    pages = []
+    for url in url_map:
+        path = os.path.join(data_dir, "%s.html" % hash_url(url))
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                selector = etree.HTML(f.read())
+            if selector is not None:
+                pages.append(selector)
+    items = [item for page in pages for item in xpaths.FEED_ITEMS(page)]
+
+    lines = []
+    for name, compiled in vars(xpaths).items():
+        if not isinstance(compiled, etree.XPath):
+            continue
+        nodes = pages if compiled.path.startswith(("//", "body")) else items
+        variables = {"n": 3} if "$n" in compiled.path else {}
+        timings = []
+        for run in (
+            lambda node: node.xpath(compiled.path, **variables),
+            lambda node: compiled(node, **variables),
+        ):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for node in nodes:
+                    run(node)
+            timings.append((time.perf_counter() - start) / max(rounds * len(nodes), 1))
+        lines.append(
+            "%-18s %6d次  字符串 %7.2fus  预编译 %7.2fus  节省 %5.1f%%"
+            % (
+                name,
+                rounds * len(nodes),
+                timings[0] * 1e6,
+                timings[1] * 1e6,
+                (1 - timings[1] / timings[0]) * 100 if timings[0] else 0,
+            )
+        )
+    return "\n".join(lines)
+
+
+def make_feed_page(data_dir, copies):
+    """把录制的第一页中的微博重复copies次(id各不相同)，拼成一个大的feed页"""
+    with open(os.path.join(data_dir, "%s.html" % hash_url(FEED_URL)), "rb") as f:
+        items = xpaths.FEED_ITEMS(etree.HTML(f.read()))
+    weibos = [etree.tostring(i, encoding="unicode", with_tail=False) for i in items[:-1]]
+    pager = etree.tostring(items[-1], encoding="unicode", with_tail=False)
+    body = "".join(
+        w.replace('id="M_', 'id="M_%d_' % n) for n in range(copies) for w in weibos
+    )
+    return (
+        '<html><head><meta charset="utf-8"/></head><body>%s%s</body></html>'
+        % (body, pager)
+    ).encode("utf-8")
+
+
+def _parse_feed_page(conn, data_dir, stream, chunk_size):
+    """在子进程中解析一次第一页，发回 (条目数, 首条耗时, 总耗时, 峰值RSS增量)"""
+    http_util.configure(NO_RATE_LIMIT)
+    http_util.set_transport(ReplayAdapter(data_dir))
+    response_cache.configure({"enabled": 0})
+    configure_streaming({"enabled": stream, "chunk_size": chunk_size})
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    first = None
+    count = 0
+    parser = PageParser(COOKIE, 0, datetime(1970, 1, 1), 1)
+    for item in parser.get_feed_items():
+        if first is None:
+            first = time.perf_counter() - start
+        parser.parse_one_weibo(item)
+        count += 1
+    total = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    conn.send((count, first or 0, total, peak * 1024))
+
+
+def bench_stream(data_dir, copies, rounds, chunk_size=16 * 1024):
+    """比较整页解析与流式解析同一个大feed页的首条耗时、总耗时与峰值内存，
+    每次解析在新的子进程中进行，峰值内存取ru_maxrss的增量"""
+    context = multiprocessing.get_context("fork")
+    lines = []
+    with tempfile.TemporaryDirectory() as tmp:
+        page = make_feed_page(data_dir, copies)
+        with open(os.path.join(tmp, "%s.html" % hash_url(FEED_URL)), "wb") as f:
+            f.write(page)
+        lines.append("feed页 %.1fKiB" % (len(page) / 1024))
+        for name, stream in (("整页解析", 0), ("流式解析", 1)):
+            runs = []
+            for _ in range(rounds):
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=_parse_feed_page, args=(sender, tmp, stream, chunk_size)
+                )
+                process.start()
+                runs.append(receiver.recv())
+                process.join()
+            count = runs[0][0]
+            lines.append(
+                "%-10s %6d条  首条 %8.3fms  总计 %8.1fms  峰值内存 %8.1fKiB"
+                % (
+                    name,
+                    count,
+                    statistics.median(r[1] for r in runs) * 1000,
+                    statistics.median(r[2] for r in runs) * 1000,
+                    statistics.median(r[3] for r in runs) / 1024,
+                )
+            )
+    return "\n".join(lines)
+
+
+def make_weibos(count):
+    weibos = []
+    for i in range(count):
+        weibo = Weibo()
+        weibo.id = "N%013d" % i
+        weibo.user_id = str(1000 + i % 50)
+        weibo.content = "第%d条测试微博的内容" % i
+        weibo.original_pictures = (
+            "https://wx1.sinaimg.cn/large/%da.jpg" % i,
+            "https://wx1.sinaimg.cn/large/%db.jpg" % i,
+        )
+        weibos.append(weibo)
+    return weibos
+
+
+def bench_records(count):
+    """count条Weibo记录占用的内存以及to_dict()/to_tuple()的吞吐，不需要录制数据"""
+    tracemalloc.start()
+    weibos = make_weibos(count)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    lines = ["Weibo记录   %6d条  共%.1fMiB  每条%d字节" % (count, memory / 2**20, memory / count)]
+    for method in ("to_dict", "to_tuple"):
+        start = time.perf_counter()
+        for weibo in weibos:
+            getattr(weibo, method)()
+        elapsed = time.perf_counter() - start
+        lines.append("%-12s %9.1f条/秒" % (method, count / elapsed))
+    return "\n".join(lines)
+
+
+def bench_writers(count, mongo_uri=None, mysql_config=None, batch_size=20):
+    """count条微博按每批batch_size条写入SqliteWriter(以及给出配置时的MongoWriter、MySqlWriter)的吞吐，
+    每种写入方式先插入一遍再upsert一遍"""
+    weibos = make_weibos(count)
+    batches = [weibos[i : i + batch_size] for i in range(0, count, batch_size)]
+    writers = []
+    with tempfile.TemporaryDirectory() as tmp:
+        writers.append(("sqlite", SqliteWriter(os.path.join(tmp, "weibo.db"))))
+        if mongo_uri:
+            writer = MongoWriter({"connection_string": mongo_uri})
+            writer._get_collection("weibo").drop()
+            writer._collections.clear()
+            writers.append(("mongo", writer))
+        if mysql_config:
+            writers.append(("mysql", MySqlWriter(mysql_config)))
+
+        lines = []
+        for name, writer in writers:
+            for phase in ("insert", "upsert"):
+                start = time.perf_counter()
+                for batch in batches:
+                    writer.write_weibo(batch)
+                elapsed = time.perf_counter() - start
+                lines.append(
+                    "%-12s %6d条  %9.1f条/秒" % (name + " " + phase, count, count / elapsed)
+                )
+            writer.close()
+    return "\n".join(lines)
+
+
+def bench_importtime(rounds, budget_ms=None, module="wb_feed_spider.spider", top=10):
+    """在新的子进程中用 python -X importtime 导入module，取rounds次中最快的一次，
+    返回(报告, 是否通过)；导入了LAZY_MODULES中的模块，或给出budget_ms且耗时超出时不通过。
+    耗时随机器与依赖版本变化，budget_ms应以同一台机器上测得的基线为准"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    best = None
+    for _ in range(max(rounds, 1)):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import " + module],
+            cwd=root,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode:
+            return proc.stderr, False
+        lines = [m for m in map(IMPORTTIME_PATTERN.match, proc.stderr.splitlines()) if m]
+        # 输出按后序排列，module之前缩进更深的连续行是它导入的模块
+        end = next(i for i, m in enumerate(lines) if m.group(4) == module)
+        start = end
+        while start and len(lines[start - 1].group(3)) > len(lines[end].group(3)):
+            start -= 1
+        entries = [
+            (m.group(4), int(m.group(1)), int(m.group(2))) for m in lines[start : end + 1]
+        ]
+        total = entries[-1][2]
+        if best is None or total < best[0]:
+            best = (total, entries)
+
+    total, entries = best
+    lines = ["import %s  %.1fms" % (module, total / 1000)]
+    if budget_ms:
+        lines[0] += " (预算 %.0fms%s)" % (
+            budget_ms,
+            "，超出" if total / 1000 > budget_ms else "",
+        )
+    for name, self_us, cum_us in sorted(entries, key=lambda e: e[2], reverse=True)[
+        1 : top + 1
+    ]:
+        lines.append("  %-45s 自身%7.1fms  累计%7.1fms" % (name, self_us / 1000, cum_us / 1000))
+    eager = sorted(
+        {name for name, _, _ in entries if name.split(".")[0] in LAZY_MODULES}
+    )
+    if eager:
+        lines.append("启动时导入了应延迟导入的模块: " + ", ".join(eager))
+    over_budget = bool(budget_ms) and total / 1000 > budget_ms
+    return "\n".join(lines), not eager and not over_budget
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用录制的页面离线测量解析性能")
+    parser.add_argument("--data", default=TEST_DATA_DIR, help="录制数据所在目录")
+    parser.add_argument("--rounds", type=int, default=5, help="计时轮数")
+    parser.add_argument("--max-page", type=int, default=1, help="get_feed爬取的页数")
+    parser.add_argument(
+        "--records", type=int, default=0, help="只测量这么多条Weibo记录的内存与序列化"
+    )
+    parser.add_argument(
+        "--writers", type=int, default=0, help="只测量这么多条微博的写入吞吐"
+    )
+    parser.add_argument("--mongo", help="同时测量MongoWriter时使用的连接串")
+    parser.add_argument(
+        "--mysql", type=json.loads, help="同时测量MySqlWriter时使用的mysql_config(json)"
+    )
+    parser.add_argument(
+        "--xpaths",
+        action="store_true",
+        help="只比较字符串XPath与预编译XPath在录制页面上的耗时",
+    )
+    parser.add_argument(
+        "--stream",
+        type=int,
+        default=0,
+        metavar="COPIES",
+        help="只比较整页解析与流式解析：把录制的第一页中的微博重复COPIES次拼成大页面",
+    )
+    parser.add_argument(
+        "--importtime",
+        type=float,
+        nargs="?",
+        const=0,
+        metavar="BUDGET_MS",
+        help="只测量导入spider模块的耗时，提前导入了lxml等模块或超过BUDGET_MS毫秒时返回1；"
+        "耗时与机器有关，BUDGET_MS应按本机的基线设置",
+    )
+    args = parser.parse_args(argv)
+
+    if args.importtime is not None:
+        report, ok = bench_importtime(args.rounds, args.importtime)
+        print(report)
+        return 0 if ok else 1
+    if args.writers:
+        logging.getLogger("spider").setLevel(logging.WARNING)
+        print(bench_writers(args.writers, args.mongo, args.mysql))
+        return
+    if args.records:
+        print(bench_records(args.records))
+        return
+
+    url_map = load_url_map(args.data)
+    if args.stream:
+        logging.getLogger("spider").setLevel(logging.WARNING)
+        print(bench_stream(args.data, args.stream, args.rounds))
+        return
+    if args.xpaths:
+        print(bench_xpaths(args.data, url_map, args.rounds * 200))
+        return
+    http_util.configure(NO_RATE_LIMIT)
+    http_util.set_transport(ReplayAdapter(args.data))
+    # 每轮都要真正解析回放的页面，不经过响应缓存
+    response_cache.configure({"enabled": 0})
+    logging.getLogger("spider").setLevel(logging.WARNING)
+
+    results = [
+        bench_page_parser(url_map, args.rounds),
+        bench_comment_parser(url_map, args.rounds),
+        bench_user_parser(url_map, args.rounds),
+        bench_get_feed(url_map, args.rounds, args.max_page),
+    ]
+    for result in results:
+        print(result.report())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,15 @@ from datetime import datetime
 
 logger = logging.getLogger("spider.config_util")
 
+# 由spider.configure_process设置、同一进程内所有Spider共享的配置，多账号模式下不能按账号覆盖
+PROCESS_CONFIG_KEYS = (
+    "http_config",
+    "response_cache",
+    "enrich_config",
+    "stream_parse",
+    "download_config",
+)
+
 
 def validate_config(config):
     """验证配置是否正确"""
@@ -16,6 +25,80 @@ def validate_config(config):
         if config[argument] != 0 and config[argument] != 1:
             logger.warning("%s值应为0或1,请重新输入", config[argument])
             sys.exit()
+    if config.get("async_mode", 0) not in (0, 1):
+        logger.warning("async_mode值应为0或1,请重新输入")
+        sys.exit()
+
+    # 验证刷新间隔
+    interval = config["refresh_interval"]
+    min_interval = config.get("min_refresh_interval", interval)
+    max_interval = config.get("max_refresh_interval", interval)
+    if not 0 < min_interval <= interval <= max_interval:
+        logger.warning(
+            "刷新间隔应满足 0 < min_refresh_interval <= refresh_interval <= max_refresh_interval"
+        )
+        sys.exit()
+
+    # 验证max_page、page_prefetch
+    if not isinstance(config.get("max_page", 1), int) or config.get("max_page", 1) < 1:
+        logger.warning("max_page值应为正整数")
+        sys.exit()
+    if (
+        not isinstance(config.get("page_prefetch", 2), int)
+        or config.get("page_prefetch", 2) < 0
+    ):
+        logger.warning("page_prefetch值应为非负整数")
+        sys.exit()
+
+    # 验证enrich_config
+    enrich_config = config.get("enrich_config", {})
+    workers = enrich_config.get("workers", 4)
+    timeout = enrich_config.get("timeout", 30)
+    if not isinstance(workers, int) or workers < 1:
+        logger.warning("enrich_config中的workers值应为正整数")
+        sys.exit()
+    if not isinstance(timeout, (int, float)) or timeout <= 0:
+        logger.warning("enrich_config中的timeout值应为正数")
+        sys.exit()
+
+    # 验证stream_parse
+    chunk_size = config.get("stream_parse", {}).get("chunk_size", 16 * 1024)
+    if not isinstance(chunk_size, int) or chunk_size < 1:
+        logger.warning("stream_parse中的chunk_size值应为正整数")
+        sys.exit()
+
+    # 验证file_config
+    file_config = config.get("file_config", {})
+    if file_config.get("compression", "") not in ("", "gzip", "zstd"):
+        logger.warning("file_config中的compression值应为空字符串、gzip或zstd")
+        sys.exit()
+    if file_config.get("fsync", "interval") not in ("always", "interval", "never"):
+        logger.warning("file_config中的fsync值应为always、interval或never")
+        sys.exit()
+
+    # 验证accounts(多账号模式)
+    accounts = config.get("accounts", [])
+    if not isinstance(accounts, list):
+        logger.warning("accounts值应为list类型")
+        sys.exit()
+    names = set()
+    for account in accounts:
+        if not (
+            isinstance(account, dict) and account.get("name") and account.get("cookie")
+        ):
+            logger.warning("accounts中的每一项都应包含name与cookie")
+            sys.exit()
+        process_keys = [k for k in PROCESS_CONFIG_KEYS if k in account]
+        if process_keys:
+            logger.warning(
+                "accounts中的%s在同一进程的各账号间共享，只能在全局配置中设置",
+                "、".join(process_keys),
+            )
+            sys.exit()
+        if account["name"] in names:
+            logger.warning("accounts中的账号名%s重复", account["name"])
+            sys.exit()
+        names.add(account["name"])
 
     # 验证write_mode
     write_mode = ["txt", "csv", "json", "mongo", "mysql", "sqlite", "kafka"]
@@ -1,9 +1,11 @@
+from .downloader import configure_download_pool
 from .origin_picture_downloader import OriginPictureDownloader
 from .retweet_picture_downloader import RetweetPictureDownloader
 from .avatar_picture_downloader import AvatarPictureDownloader
 from .video_downloader import VideoDownloader
 
 __all__ = [
+    configure_download_pool,
     OriginPictureDownloader,
     RetweetPictureDownloader,
     AvatarPictureDownloader,
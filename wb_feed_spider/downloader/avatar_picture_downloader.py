@@ -19,4 +19,4 @@ class AvatarPictureDownloader(ImgDownloader):
             index = url.rfind("/")
             file_name = url[index:]
             file_path = file_dir + os.sep + file_name
-            self.download_one_file(url, file_path, "xxx")
+            self.submit_one_file(url, file_path, "xxx")
@@ -2,16 +2,59 @@
 import logging
 import os
 import sys
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
 
 import requests
-from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
+from .. import metrics
+from ..http_util import get_session
+
 logger = logging.getLogger("spider.downloader")
 
+# 所有Downloader共享的下载线程池及每个host的并发上限
+_pool_config = {"workers": 8, "per_host": 4, "chunk_size": 64 * 1024}
+_executor = None
+_host_slots = {}
+_lock = threading.Lock()
+
+
+def configure_download_pool(download_config=None):
+    """设置下载线程数、每个host的最大并发数与流式写入的块大小"""
+    global _executor
+    with _lock:
+        _pool_config.update(download_config or {})
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = None
+        _host_slots.clear()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_pool_config["workers"], thread_name_prefix="download"
+            )
+        return _executor
+
+
+def _host_slot(url) -> threading.BoundedSemaphore:
+    host = urlsplit(url).hostname or ""
+    with _lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(_pool_config["per_host"])
+        return _host_slots[host]
+
 
 class Downloader(ABC):
+    # 是否保留未下载完的.part文件，下次通过HTTP Range续传
+    resume = False
+
     def __init__(self, file_dir, file_download_timeout):
         self.file_dir = file_dir
         self.describe = ""
@@ -22,27 +65,61 @@ class Downloader(ABC):
                 v = file_download_timeout[i]
                 if isinstance(v, (int, float)) and v > 0:
                     self.file_download_timeout[i] = v
+        self._local = threading.local()
 
     @abstractmethod
     def handle_download(self, urls, w):
         """下载 urls 里所指向的图片或视频文件，使用 w 里的信息来生成文件名"""
         pass
 
+    def _fetch_to_part(self, url, part_path):
+        """把url的内容流式写入part_path，支持时从已有部分续传"""
+        offset = 0
+        headers = {}
+        if self.resume and os.path.isfile(part_path):
+            offset = os.path.getsize(part_path)
+            headers["Range"] = "bytes=%d-" % offset
+        downloaded = 0
+        name = type(self).__name__
+        with metrics.span("download_file", downloader=name), get_session().get(
+            url,
+            headers=headers,
+            stream=True,
+            timeout=(self.file_download_timeout[1], self.file_download_timeout[2]),
+        ) as resp:
+            if offset and resp.status_code == 416:  # 已经下载完整
+                return
+            resp.raise_for_status()
+            mode = "ab" if offset and resp.status_code == 206 else "wb"
+            try:
+                with open(part_path, mode) as f:
+                    for chunk in resp.iter_content(_pool_config["chunk_size"]):
+                        f.write(chunk)
+                        downloaded += len(chunk)
+            finally:
+                metrics.inc("download_bytes_total", downloaded, downloader=name)
+
     def download_one_file(self, url, file_path, weibo_id):
-        """下载单个文件(图片/视频)"""
+        """下载单个文件(图片/视频)，先写入临时文件，完成后原子地重命名"""
         try:
             if not os.path.isfile(file_path):
-                s = requests.Session()
-                s.mount(url, HTTPAdapter(max_retries=self.file_download_timeout[0]))
-                downloaded = s.get(
-                    url,
-                    timeout=(
-                        self.file_download_timeout[1],
-                        self.file_download_timeout[2],
-                    ),
-                )
-                with open(file_path, "wb") as f:
-                    f.write(downloaded.content)
+                part_path = file_path + ".part"
+                with _host_slot(url):
+                    for i in range(self.file_download_timeout[0] + 1):
+                        try:
+                            self._fetch_to_part(url, part_path)
+                            break
+                        except (
+                            requests.ConnectionError,
+                            requests.Timeout,
+                            requests.exceptions.ChunkedEncodingError,
+                        ):
+                            if i == self.file_download_timeout[0]:
+                                if not self.resume and os.path.isfile(part_path):
+                                    os.remove(part_path)
+                                raise
+                            metrics.inc("retries_total", kind="download")
+                os.replace(part_path, file_path)
         except Exception as e:
             error_file = self.file_dir + os.sep + "not_downloaded.txt"
             with open(error_file, "ab") as f:
@@ -50,13 +127,31 @@ class Downloader(ABC):
                 f.write(url.encode(sys.stdout.encoding))
             logger.exception(e)
 
+    def submit_one_file(self, url, file_path, weibo_id):
+        """把单个文件交给下载线程池，由wait()等待完成"""
+        if not hasattr(self._local, "pending"):
+            self._local.pending = []
+        self._local.pending.append(
+            _get_executor().submit(self.download_one_file, url, file_path, weibo_id)
+        )
+
+    def wait(self):
+        """等待当前线程提交的所有下载完成"""
+        pending = getattr(self._local, "pending", [])
+        self._local.pending = []
+        for _ in tqdm(as_completed(pending), total=len(pending), desc="Download progress"):
+            pass
+
     def download_files(self, weibos):
         """下载文件(图片/视频)"""
         try:
             logger.info("即将进行%s下载", self.describe)
-            for w in tqdm(weibos, desc="Download progress"):
-                if getattr(w, self.key) != "无":
-                    self.handle_download(getattr(w, self.key), w)
+            with metrics.span("download", downloader=type(self).__name__):
+                for w in weibos:
+                    urls = getattr(w, self.key)
+                    if urls and urls != "无":
+                        self.handle_download(urls, w)
+                self.wait()
             logger.info("%s下载完毕,保存路径:", self.describe)
             logger.info(self.file_dir)
         except Exception as e:
@@ -1,6 +1,7 @@
 import os
 
 from .downloader import Downloader
+from .media_store import MediaStore
 
 
 class ImgDownloader(Downloader):
@@ -8,6 +9,18 @@ class ImgDownloader(Downloader):
         super().__init__(file_dir, file_download_timeout)
         self.describe = "图片"
         self.key = ""
+        self.media_store = MediaStore(file_dir)
+
+    def download_one_file(self, url, file_path, weibo_id):
+        """同一张图片只下载一次，之后的微博直接链接到已保存的内容"""
+        if os.path.isfile(file_path):
+            return
+        blob_path = self.media_store.blob_path(url)
+        with self.media_store.lock(blob_path):
+            if not os.path.isfile(blob_path):
+                super().download_one_file(url, blob_path, weibo_id)
+        if os.path.isfile(blob_path):
+            self.media_store.link(blob_path, file_path)
 
     def handle_download(self, urls, w):
         """处理下载相关操作"""
@@ -15,9 +28,8 @@ class ImgDownloader(Downloader):
         file_dir = self.file_dir + os.sep + self.describe
         if not os.path.isdir(file_dir):
             os.makedirs(file_dir)
-        if "," in urls:
-            url_list = urls.split(",")
-            for i, url in enumerate(url_list):
+        if len(urls) > 1:
+            for i, url in enumerate(urls):
                 index = url.rfind(".")
                 if len(url) - index >= 5:
                     file_suffix = ".jpg"
@@ -25,13 +37,14 @@ class ImgDownloader(Downloader):
                     file_suffix = url[index:]
                 file_name = file_prefix + "_" + str(i + 1) + file_suffix
                 file_path = file_dir + os.sep + file_name
-                self.download_one_file(url, file_path, w.id)
+                self.submit_one_file(url, file_path, w.id)
         else:
-            index = urls.rfind(".")
-            if len(urls) - index > 5:
+            url = urls[0]
+            index = url.rfind(".")
+            if len(url) - index > 5:
                 file_suffix = ".jpg"
             else:
-                file_suffix = urls[index:]
+                file_suffix = url[index:]
             file_name = file_prefix + file_suffix
             file_path = file_dir + os.sep + file_name
-            self.download_one_file(urls, file_path, w.id)
+            self.submit_one_file(url, file_path, w.id)
@@ -0,0 +1,64 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("spider.media_store")
+
+# 新浪图床的url形如 https://wx1.sinaimg.cn/large/<图片id>.jpg，
+# 同一张图片在不同微博、不同图床节点上的<尺寸>/<图片id>相同
+SINAIMG_PATTERN = re.compile(r"^/([^/]+)/([0-9A-Za-z]+)(\.\w+)?$")
+
+# 仓库目录 -> 分段锁，同一目录的多个MediaStore实例(各下载器各建一个)共用同一组锁
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _striped_locks(root):
+    with _locks_guard:
+        if root not in _locks:
+            _locks[root] = [threading.Lock() for _ in range(64)]
+        return _locks[root]
+
+
+class MediaStore:
+    """内容寻址的图片仓库
+
+    每张图片只下载、保存一次(root/.blobs下)，各微博对应的文件以硬链接指向同一份内容，
+    文件系统不支持硬链接时退化为复制。
+    """
+
+    def __init__(self, root):
+        self.root = root + os.sep + ".blobs"
+        self._locks = _striped_locks(os.path.abspath(self.root))
+
+    def blob_path(self, url):
+        """由url计算图片在仓库中的路径，新浪图床按图片id，其它按url的哈希"""
+        parts = urlsplit(url)
+        match = SINAIMG_PATTERN.match(parts.path)
+        if (parts.hostname or "").endswith("sinaimg.cn") and match:
+            size, key, suffix = match.group(1), match.group(2), match.group(3)
+            file_dir = self.root + os.sep + size + os.sep + key[-2:]
+        else:
+            key = hashlib.sha1(url.encode("utf8")).hexdigest()
+            suffix = os.path.splitext(parts.path)[1]
+            file_dir = self.root + os.sep + "url" + os.sep + key[:2]
+        if not os.path.isdir(file_dir):
+            os.makedirs(file_dir, exist_ok=True)
+        return file_dir + os.sep + key + (suffix or ".jpg")
+
+    def lock(self, blob_path) -> threading.Lock:
+        """同一份内容同时只允许一个线程下载"""
+        return self._locks[hash(blob_path) % len(self._locks)]
+
+    def link(self, blob_path, file_path):
+        """让file_path指向仓库中的内容"""
+        try:
+            os.link(blob_path, file_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copyfile(blob_path, file_path)
@@ -4,6 +4,8 @@ from .downloader import Downloader
 
 
 class VideoDownloader(Downloader):
+    resume = True
+
     def __init__(self, file_dir, file_download_timeout):
         super().__init__(file_dir, file_download_timeout)
         self.describe = "视频"
@@ -15,4 +17,4 @@ class VideoDownloader(Downloader):
         file_suffix = ".mp4"
         file_name = file_prefix + file_suffix
         file_path = self.file_dir + os.sep + file_name
-        self.download_one_file(urls, file_path, w.id)
+        self.submit_one_file(urls, file_path, w.id)
@@ -0,0 +1,274 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+logger = logging.getLogger("spider.http_util")
+
+# 全局默认值，可被config.json中的http_config覆盖；hosts中的键按域名后缀匹配
+DEFAULT_HTTP_CONFIG = {
+    "pool_connections": 10,  # 每个连接池管理器缓存的host数
+    "pool_maxsize": 10,  # 每个host保持的最大keep-alive连接数
+    "max_retries": 3,
+    "backoff_factor": 0.5,
+    "timeout": [5, 10],  # 连接超时、读取超时
+    "rate_limit": 0,  # 每个host每秒最多发起的请求数，0表示不限速
+    "burst": 2,  # 令牌桶容量，即允许的瞬时并发请求数
+    "min_rate": 0.1,  # 被限速时速率的下限
+    "aimd_increase": 0.05,  # 每次成功的请求使速率增加的量
+    "aimd_decrease": 0.5,  # 被限速时速率乘以的系数
+    "hosts": {
+        "weibo.cn": {"pool_maxsize": 4, "rate_limit": 2},
+        # 媒体文件的重试由Downloader按file_download_timeout处理
+        "sinaimg.cn": {"pool_maxsize": 8, "max_retries": 0},
+    },
+}
+
+LIMIT_KEYS = ("rate_limit", "burst", "min_rate", "aimd_increase", "aimd_decrease")
+# 反爬虫拒绝请求时返回的状态码
+PENALTY_STATUS = (403, 418, 429)
+
+_session = None
+_http_config = DEFAULT_HTTP_CONFIG
+_transport = None
+_lock = threading.Lock()
+
+
+def _host_of(url):
+    return urlsplit(url).hostname or ""
+
+
+def _match_suffix(host, suffixes):
+    for suffix in suffixes:
+        if host == suffix or host.endswith("." + suffix):
+            return suffix
+    return None
+
+
+class _Bucket:
+    __slots__ = (
+        "rate",
+        "max_rate",
+        "min_rate",
+        "burst",
+        "increase",
+        "decrease",
+        "tokens",
+        "last",
+    )
+
+    def __init__(self, params):
+        self.rate = self.max_rate = params["rate_limit"]
+        self.min_rate = min(params["min_rate"], self.max_rate)
+        self.burst = params["burst"]
+        self.increase = params["aimd_increase"]
+        self.decrease = params["aimd_decrease"]
+        self.tokens = self.burst
+        self.last = time.monotonic()
+
+
+class TokenBucketLimiter:
+    """按host(或hosts中配置的域名后缀)的令牌桶限速，超出时阻塞调用线程
+
+    速率按AIMD自适应：每次成功的请求使速率加上aimd_increase，直到rate_limit；
+    收到418/403/429、请求出错或解析出空页面时速率乘以aimd_decrease，不低于min_rate，
+    并清空桶中的令牌。rate_limit为0的host不限速。
+    """
+
+    def __init__(self, http_config: dict):
+        self.default_params = {k: http_config[k] for k in LIMIT_KEYS}
+        self.host_params = {
+            suffix: {k: host_config.get(k, http_config[k]) for k in LIMIT_KEYS}
+            for suffix, host_config in http_config.get("hosts", {}).items()
+        }
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        suffix = _match_suffix(host, self.host_params)
+        key = suffix or host
+        if key not in self._buckets:
+            params = self.host_params[suffix] if suffix else self.default_params
+            self._buckets[key] = _Bucket(params) if params["rate_limit"] > 0 else None
+        return key, self._buckets[key]
+
+    def acquire(self, host):
+        """取一个令牌，没有令牌时等待到下一个令牌生成"""
+        with self._lock:
+            _, bucket = self._bucket(host)
+            if bucket is None:
+                return
+            now = time.monotonic()
+            bucket.tokens = min(
+                bucket.burst, bucket.tokens + (now - bucket.last) * bucket.rate
+            )
+            bucket.last = now
+            bucket.tokens -= 1
+            wait = -bucket.tokens / bucket.rate if bucket.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def reward(self, host):
+        with self._lock:
+            _, bucket = self._bucket(host)
+            if bucket is not None and bucket.rate < bucket.max_rate:
+                bucket.rate = min(bucket.max_rate, bucket.rate + bucket.increase)
+
+    def penalize(self, host):
+        with self._lock:
+            key, bucket = self._bucket(host)
+            if bucket is None:
+                return
+            bucket.rate = max(bucket.min_rate, bucket.rate * bucket.decrease)
+            bucket.tokens = min(bucket.tokens, 0)
+            rate = bucket.rate
+        metrics.inc("rate_limit_penalties_total", host=key)
+        logger.info("%s的请求速率降为每秒%.2f次", key, rate)
+
+
+class PooledSession(requests.Session):
+    """进程内共享的HTTP会话，按host复用keep-alive连接并统计请求数与新建连接数"""
+
+    def __init__(self, http_config: dict):
+        super().__init__()
+        self.timeout = tuple(http_config["timeout"])
+        self.default_adapter = self._make_adapter(http_config, {})
+        self.mount("https://", self.default_adapter)
+        self.mount("http://", self.default_adapter)
+        self.host_adapters = {
+            suffix: self._make_adapter(http_config, host_config)
+            for suffix, host_config in http_config.get("hosts", {}).items()
+        }
+        self.transport = None  # 设置后所有请求都交给它处理，用于离线回放
+        self.rate_limiter = TokenBucketLimiter(http_config)
+        self._requests = {}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _make_adapter(http_config: dict, host_config: dict) -> HTTPAdapter:
+        def get(key):
+            return host_config.get(key, http_config[key])
+
+        retry = Retry(
+            total=get("max_retries"),
+            backoff_factor=get("backoff_factor"),
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        return HTTPAdapter(
+            pool_connections=get("pool_connections"),
+            pool_maxsize=get("pool_maxsize"),
+            max_retries=retry,
+        )
+
+    def get_adapter(self, url):
+        if self.transport is not None:
+            return self.transport
+        suffix = _match_suffix(_host_of(url), self.host_adapters)
+        if suffix:
+            return self.host_adapters[suffix]
+        return super().get_adapter(url)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        host = _host_of(url)
+        self.rate_limiter.acquire(host)
+        with self._stats_lock:
+            self._requests[host] = self._requests.get(host, 0) + 1
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            self.rate_limiter.penalize(host)
+            raise
+        if resp.status_code in PENALTY_STATUS:
+            self.rate_limiter.penalize(host)
+        elif resp.status_code < 400:
+            self.rate_limiter.reward(host)
+        metrics.inc("http_requests_total", host=host, status=resp.status_code)
+        retries = getattr(getattr(resp.raw, "retries", None), "history", ())
+        if retries:
+            metrics.inc("retries_total", len(retries), kind="http")
+        return resp
+
+    def host_stats(self) -> dict:
+        """返回 {host: {"requests": 请求数, "connections": 新建连接数, "reused": 复用次数}}"""
+        connections = {}
+        for adapter in [self.default_adapter] + list(self.host_adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    connections[pool.host] = (
+                        connections.get(pool.host, 0) + pool.num_connections
+                    )
+        stats = {}
+        with self._stats_lock:
+            requests_by_host = dict(self._requests)
+        for host, num in requests_by_host.items():
+            conn = connections.get(host, 0)
+            stats[host] = {
+                "requests": num,
+                "connections": conn,
+                "reused": max(num - conn, 0),
+            }
+        return stats
+
+
+def configure(http_config=None):
+    """根据http_config重建共享会话，未给出的项使用DEFAULT_HTTP_CONFIG"""
+    global _session, _http_config
+    config = dict(DEFAULT_HTTP_CONFIG)
+    config.update(http_config or {})
+    hosts = dict(DEFAULT_HTTP_CONFIG["hosts"])
+    hosts.update((http_config or {}).get("hosts", {}))
+    config["hosts"] = hosts
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _http_config = config
+        _session = None
+
+
+def get_session() -> PooledSession:
+    """获取进程内共享的HTTP会话"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = PooledSession(_http_config)
+                _session.transport = _transport
+    return _session
+
+
+def set_transport(adapter):
+    """让共享会话的所有请求都交给adapter处理(例如ReplayAdapter)，传入None恢复网络请求"""
+    global _transport
+    with _lock:
+        _transport = adapter
+        if _session is not None:
+            _session.transport = adapter
+
+
+def penalize(url):
+    """url返回了被限制访问的内容(如空页面)时调用，降低对应host的请求速率"""
+    get_session().rate_limiter.penalize(_host_of(url))
+
+
+def log_host_stats():
+    """输出各host的请求数与连接复用情况"""
+    if _session is None:
+        return
+    for host, s in sorted(_session.host_stats().items()):
+        logger.info(
+            "%s: %d次请求, 新建%d个连接, 复用%d次",
+            host,
+            s["requests"],
+            s["connections"],
+            s["reused"],
+        )
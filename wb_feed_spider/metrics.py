@@ -0,0 +1,171 @@
+"""进程内的计数器与耗时统计
+
+    with metrics.span("fetch", kind="feed"):   # 记录一段代码的耗时
+        ...
+    metrics.inc("http_requests_total", host="weibo.cn")
+
+start_http_server(port)后可以在 http://<host>:<port>/metrics 以Prometheus文本格式读取全部指标，
+log_refresh_summary()输出自上一次调用以来各span的耗时分布。
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger("spider.metrics")
+
+PREFIX = "wb_"
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_spans = {}  # labels -> [count, sum, max]，累计值
+_window = {}  # labels -> [count, sum, max]，本次刷新的值
+_server = None
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """计数器name加value"""
+    key = (name, _key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(span_name, seconds, **labels):
+    """记录一次名为span_name的耗时"""
+    _observe(_key(dict(labels, span=span_name)), seconds)
+
+
+def _observe(key, seconds):
+    with _lock:
+        for table in (_spans, _window):
+            stat = table.get(key)
+            if stat is None:
+                table[key] = [1, seconds, seconds]
+            else:
+                stat[0] += 1
+                stat[1] += seconds
+                if seconds > stat[2]:
+                    stat[2] = seconds
+
+
+@contextmanager
+def span(span_name, **labels):
+    """记录with块的耗时，块内抛出异常时同样记录"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(span_name, time.perf_counter() - start, **labels)
+
+
+def timed(span_name, **labels):
+    """记录被装饰函数每次调用的耗时"""
+
+    key = _key(dict(labels, span=span_name))
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _observe(key, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels
+    )
+
+
+def render():
+    """以Prometheus文本格式返回全部指标"""
+    with _lock:
+        counters = sorted(_counters.items())
+        spans = sorted((k, list(v)) for k, v in _spans.items())
+    lines = []
+    last_name = None
+    for (name, labels), value in counters:
+        if name != last_name:
+            lines.append("# TYPE %s%s counter" % (PREFIX, name))
+            last_name = name
+        lines.append("%s%s%s %s" % (PREFIX, name, _format_labels(labels), value))
+    if spans:
+        lines.append("# TYPE %sspan_seconds summary" % PREFIX)
+        for labels, (count, total, _) in spans:
+            lines.append("%sspan_seconds_count%s %d" % (PREFIX, _format_labels(labels), count))
+            lines.append("%sspan_seconds_sum%s %.6f" % (PREFIX, _format_labels(labels), total))
+        lines.append("# TYPE %sspan_seconds_max gauge" % PREFIX)
+        for labels, (_, _, longest) in spans:
+            lines.append("%sspan_seconds_max%s %.6f" % (PREFIX, _format_labels(labels), longest))
+    return "\n".join(lines) + "\n"
+
+
+def log_refresh_summary(top=15):
+    """按总耗时从高到低输出本次刷新中耗时最多的span，并清空本次刷新的统计"""
+    global _window
+    with _lock:
+        window, _window = _window, {}
+    if not window:
+        return
+    logger.info("本次刷新耗时分布(总耗时/次数/平均/最长):")
+    for labels, (count, total, longest) in sorted(
+        window.items(), key=lambda kv: kv[1][1], reverse=True
+    )[:top]:
+        logger.info(
+            "  %-45s %8.3fs %6d次 %8.1fms %8.1fms",
+            ",".join("%s=%s" % kv for kv in labels),
+            total,
+            count,
+            total / count * 1000,
+            longest * 1000,
+        )
+
+
+def _make_handler():
+    # 只在开启指标端口时才导入http.server
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """在后台线程中提供 /metrics ，返回服务器对象"""
+    global _server
+    if _server is None:
+        from http.server import ThreadingHTTPServer
+
+        _server = ThreadingHTTPServer((host, port), _make_handler())
+        threading.Thread(
+            target=_server.serve_forever, name="metrics", daemon=True
+        ).start()
+        logger.info("指标地址: http://%s:%d/metrics", host, _server.server_port)
+    return _server
@@ -1,6 +1,14 @@
 from .index_parser import IndexParser
-from .page_parser import PageParser
+from .page_parser import PageParser, configure_enrichment
 from .photo_parser import PhotoParser
 from .album_parser import AlbumParser
+from .util import configure_streaming
 
-__all__ = [IndexParser, PageParser, PhotoParser, AlbumParser]
+__all__ = [
+    IndexParser,
+    PageParser,
+    PhotoParser,
+    AlbumParser,
+    configure_enrichment,
+    configure_streaming,
+]
@@ -1,3 +1,4 @@
+from . import xpaths
 from .parser import Parser
 from .util import handle_html
 
@@ -10,7 +11,7 @@ class AlbumParser(Parser):
 
     def extract_pic_urls(self):
         # <img src="http://wx2.sinaimg.cn/wap180/76102133ly8fwr33wpn8fj20v90v9tbw.jpg" alt="" class="c">
-        pic_list = self.selector.xpath('//div[@class="c"]//img/@src')
+        pic_list = xpaths.ALBUM_PICTURES(self.selector)
         for i, pic in enumerate(pic_list):
             if "?" in pic:
                 pic = pic[: pic.index("?")]
@@ -1,10 +1,11 @@
 import logging
-import random
 import requests
-from time import sleep
+from lxml import etree
 
+from .. import http_util, metrics
+from . import xpaths
 from .parser import Parser
-from .util import handle_garbled, handle_html
+from .util import handle_garbled, handle_html, iter_items, streaming_enabled
 
 logger = logging.getLogger("spider.comment_parser")
 
@@ -13,23 +14,44 @@ class CommentParser(Parser):
     def __init__(self, cookie, weibo_id):
         self.cookie = cookie
         self.url = "https://weibo.cn/comment/" + weibo_id
-        self.selector = handle_html(self.cookie, self.url)
+        # 流式解析时在用到时才获取页面
+        self.selector = (
+            None if streaming_enabled() else handle_html(self.cookie, self.url)
+        )
+
+    def _weibo_node(self):
+        """第二个div.c，即微博正文所在的节点，页面获取或解析失败时返回None，由调用者重试"""
+        try:
+            if streaming_enabled():
+                # 只解析到第二个div.c为止
+                items = list(iter_items(self.cookie, self.url, limit=2))
+            else:
+                self.selector = handle_html(self.cookie, self.url)
+                if self.selector is None:
+                    return None
+                items = xpaths.FEED_ITEMS(self.selector)
+        except (requests.RequestException, etree.LxmlError) as e:
+            logger.warning("获取%s失败: %s", self.url, e)
+            return None
+        # 反爬等异常页面没有正文节点
+        return items[1] if len(items) > 1 else None
 
     def get_long_weibo(self):
         """获取长原创微博"""
         try:
             for i in range(5):
-                self.selector = handle_html(self.cookie, self.url)
-                if self.selector is not None:
-                    info = self.selector.xpath("//div[@class='c']")[1]
+                info = self._weibo_node()
+                if info is not None:
                     wb_content = handle_garbled(info)
-                    wb_time = info.xpath("//span[@class='ct']/text()")[0]
+                    wb_time = xpaths.WEIBO_TIME(info)[0]
                     weibo_content = wb_content[
                         wb_content.find(":") + 1 : wb_content.rfind(wb_time)
                     ]
                     if weibo_content is not None:
                         return weibo_content
-                sleep(random.randint(6, 10))
+                # 由限速器决定下一次请求前等待多久
+                metrics.inc("retries_total", kind="comment")
+                http_util.penalize(self.url)
         except Exception:
             logger.exception("网络出错")
 
@@ -49,10 +71,11 @@ class CommentParser(Parser):
             self.selector = handle_html(self.cookie, self.url)
             if self.selector is not None:
                 # 来自微博视频号的格式与普通格式不一致，不加 span 层级
-                links = self.selector.xpath("body/div[@class='c' and @id][1]/div//a")
+                links = xpaths.VIDEO_LINKS(self.selector)
                 for a in links:
-                    if "m.weibo.cn/s/video/show?object_id=" in a.xpath("@href")[0]:
-                        video_url = a.xpath("@href")[0]
+                    href = xpaths.HREF(a)[0]
+                    if "m.weibo.cn/s/video/show?object_id=" in href:
+                        video_url = href
                         break
         except Exception:
             logger.exception("网络出错")
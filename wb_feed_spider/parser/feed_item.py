@@ -0,0 +1,78 @@
+from functools import cached_property
+
+from .util import handle_garbled
+
+
+class FeedItem:
+    """feed中的一条微博(div.c)
+
+    构造时只遍历一次各个顶层div的子节点，收集PageParser各个get_*方法需要的元素；
+    文本类的结果在第一次使用时计算一次并缓存，不再对同一节点重复执行XPath和handle_garbled。
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.id = node.get("id", "")[2:]
+        self.divs = []
+        self.div_links = []  # div/a
+        self.ct_spans = []  # div/span[@class='ct']
+        self.ctt_spans = []  # div/span[@class='ctt']
+        self.cmt_spans = []  # div/span[@class='cmt']
+        for div in node.iterchildren("div"):
+            self.divs.append(div)
+            for child in div:
+                if child.tag == "a":
+                    self.div_links.append(child)
+                elif child.tag == "span":
+                    cls = child.get("class")
+                    if cls == "ct":
+                        self.ct_spans.append(child)
+                    elif cls == "ctt":
+                        self.ctt_spans.append(child)
+                    elif cls == "cmt":
+                        self.cmt_spans.append(child)
+
+    @cached_property
+    def text(self):
+        """整条微博的文本"""
+        return handle_garbled(self.node)
+
+    @cached_property
+    def last_div_text(self):
+        """最后一个div(点赞、转发、评论所在行)的文本"""
+        return handle_garbled(self.divs[-1])
+
+    @cached_property
+    def ct_text(self):
+        """发布时间与发布工具的文本"""
+        return handle_garbled(self.ct_spans[0])
+
+    @cached_property
+    def links(self):
+        """所有div下的a元素(div//a)"""
+        return [a for div in self.divs for a in div.iter("a")]
+
+    @cached_property
+    def link_texts(self):
+        return [a.text for a in self.links if a.text is not None]
+
+    @cached_property
+    def first_div_links(self):
+        """第一个div下的a元素(div[1]//a)"""
+        return list(self.divs[0].iter("a")) if self.divs else []
+
+    @cached_property
+    def div_hrefs(self):
+        """div/a/@href"""
+        return [a.get("href") for a in self.div_links if a.get("href") is not None]
+
+    @cached_property
+    def has_img(self):
+        return any(img.get("src") for img in self.node.iter("img"))
+
+    @cached_property
+    def user_href(self):
+        for a in self.div_links:
+            if a.get("class") == "nk":
+                return a.get("href")
+        return None
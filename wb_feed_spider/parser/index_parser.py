@@ -1,6 +1,7 @@
 import logging
 
 from .info_parser import InfoParser
+from . import xpaths
 from .parser import Parser
 from .util import handle_html, string_to_int
 
@@ -17,11 +18,12 @@ class IndexParser(Parser):
     def _get_user_id(self):
         """获取用户id，使用者输入的user_id不一定是正确的，可能是个性域名等，需要获取真正的user_id"""
         user_id = self.user_uri
-        url_list = self.selector.xpath("//div[@class='u']//a")
+        url_list = xpaths.USER_LINKS(self.selector)
         for url in url_list:
-            if (url.xpath("string(.)")) == "资料":
-                if url.xpath("@href") and url.xpath("@href")[0].endswith("/info"):
-                    link = url.xpath("@href")[0]
+            if xpaths.TEXT(url) == "资料":
+                href = xpaths.HREF(url)
+                if href and href[0].endswith("/info"):
+                    link = href[0]
                     user_id = link[1:-5]
                     break
         return user_id
@@ -33,7 +35,7 @@ class IndexParser(Parser):
             self.user = InfoParser(self.cookie, user_id).extract_user_info()  # 获取用户信息
             self.user.id = user_id
 
-            user_info = self.selector.xpath("//div[@class='tip2']/*/text()")
+            user_info = xpaths.USER_COUNTS(self.selector)
             self.user.weibo_num = string_to_int(user_info[0][3:-1])
             self.user.following = string_to_int(user_info[1][3:-1])
             self.user.followers = string_to_int(user_info[2][3:-1])
@@ -44,12 +46,11 @@ class IndexParser(Parser):
     def get_page_num(self):
         """获取微博总页数"""
         try:
-            if self.selector.xpath("//input[@name='mp']") == []:
+            inputs = xpaths.PAGE_NUM_INPUTS(self.selector)
+            if inputs == []:
                 page_num = 1
             else:
-                page_num = (int)(
-                    self.selector.xpath("//input[@name='mp']")[0].attrib["value"]
-                )
+                page_num = (int)(inputs[0].attrib["value"])
             return page_num
         except Exception as e:
             logger.exception(e)
@@ -2,6 +2,7 @@ import logging
 import sys
 
 from ..user import User
+from . import xpaths
 from .parser import Parser
 from .util import handle_html
 
@@ -18,14 +19,14 @@ class InfoParser(Parser):
         """提取用户信息"""
         try:
             user = User()
-            nickname = self.selector.xpath("//title/text()")[0]
+            nickname = xpaths.TITLE(self.selector)[0]
             nickname = nickname[:-3]
             if nickname == "登录 - 新" or nickname == "新浪":
                 logger.warning("cookie错误或已过期,请按照README中方法重新获取")
                 sys.exit()
             user.nickname = nickname
 
-            basic_info = self.selector.xpath("//div[@class='c'][3]/text()")
+            basic_info = xpaths.INFO_SECTION_TEXT(self.selector, n=3)
             zh_list = ["性别", "地区", "生日", "简介", "认证", "达人"]
             en_list = [
                 "gender",
@@ -43,17 +44,17 @@ class InfoParser(Parser):
                         i.split(":", 1)[1].replace("\u3000", ""),
                     )
 
-            experienced = self.selector.xpath("//div[@class='tip'][2]/text()")
+            experienced = xpaths.INFO_TIP_TEXT(self.selector, n=2)
             if experienced and experienced[0] == "学习经历":
-                user.education = self.selector.xpath("//div[@class='c'][4]/text()")[0][
+                user.education = xpaths.INFO_SECTION_TEXT(self.selector, n=4)[0][
                     1:
                 ].replace("\xa0", " ")
-                if self.selector.xpath("//div[@class='tip'][3]/text()")[0] == "工作经历":
-                    user.work = self.selector.xpath("//div[@class='c'][5]/text()")[0][
+                if xpaths.INFO_TIP_TEXT(self.selector, n=3)[0] == "工作经历":
+                    user.work = xpaths.INFO_SECTION_TEXT(self.selector, n=5)[0][
                         1:
                     ].replace("\xa0", " ")
             elif experienced and experienced[0] == "工作经历":
-                user.work = self.selector.xpath("//div[@class='c'][4]/text()")[0][
+                user.work = xpaths.INFO_SECTION_TEXT(self.selector, n=4)[0][
                     1:
                 ].replace("\xa0", " ")
             return user
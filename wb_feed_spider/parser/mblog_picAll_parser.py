@@ -1,3 +1,4 @@
+from . import xpaths
 from .parser import Parser
 from .util import handle_html
 
@@ -9,4 +10,4 @@ class MblogPicAllParser(Parser):
         self.selector = handle_html(self.cookie, self.url)
 
     def extract_preview_picture_list(self):
-        return self.selector.xpath("//img/@src")
+        return xpaths.IMAGE_SRCS(self.selector)
@@ -1,94 +1,251 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from datetime import datetime, timedelta
 import logging
-import re
 import sys
-from .. import datetime_util
+import threading
+import time
+from .. import datetime_util, http_util, metrics
 from ..weibo import Weibo
 from .comment_parser import CommentParser
+from .feed_item import FeedItem
 from .mblog_picAll_parser import MblogPicAllParser
+from . import xpaths
 from .parser import Parser
-from .util import handle_html, handle_garbled, to_video_download_url
+from .util import (
+    fetch_html,
+    handle_garbled,
+    iter_items,
+    open_page,
+    streaming_enabled,
+    to_video_download_url,
+)
 
 logger = logging.getLogger("spider.page_parser")
 
+# 长微博、组图与视频链接这些需要额外请求的字段在共享线程池中补全，
+# 每个任务从开始执行起最多等待timeout秒，超时或失败时保留本地解析出的内容
+_enrich_config = {"workers": 4, "timeout": 30}
+_enrich_executor = None
+_enrich_lock = threading.Lock()
+
+
+class _TimedTask:
+    """记录补全任务开始执行的时刻，超时从开始执行时算起"""
+
+    __slots__ = ("task", "started")
+
+    def __init__(self, task):
+        self.task = task
+        self.started = None
+
+    def __call__(self):
+        self.started = time.monotonic()
+        return self.task()
+
+
+def configure_enrichment(enrich_config=None):
+    """设置补全任务的线程数与单个任务的超时时间"""
+    global _enrich_executor
+    with _enrich_lock:
+        _enrich_config.update(enrich_config or {})
+        if _enrich_executor is not None:
+            _enrich_executor.shutdown(wait=False, cancel_futures=True)
+        _enrich_executor = None
+
+
+def _get_enrich_executor() -> ThreadPoolExecutor:
+    global _enrich_executor
+    with _enrich_lock:
+        if _enrich_executor is None:
+            _enrich_executor = ThreadPoolExecutor(
+                max_workers=_enrich_config["workers"], thread_name_prefix="enrich"
+            )
+        return _enrich_executor
+
 
 class PageParser(Parser):
-    def __init__(self, cookie, filter, since_time) -> None:
+    def __init__(self, cookie, filter, since_time, page=1, skip_unchanged=True) -> None:
         self.cookie = cookie
+        self.filter = filter
         self.since_time = since_time
-        self.url = "https://weibo.cn/"
+        self.page = page
+        self.url = "https://weibo.cn/" if page == 1 else "https://weibo.cn/?page=%d" % page
         self.selector = ""
         self.to_continue = True
+        self.item_count = 0  # 本页的微博条目数
+        self.unchanged = False  # 页面内容与上一次刷新时完全相同
+        self.streaming = streaming_enabled()
+        self._body = None  # 流式解析时已发出请求、尚未读取的响应体
+
+        if self.streaming:
+            # 这里只发出请求；lxml的解析器不能跨线程使用，解析留到get_feed_items所在的线程
+            try:
+                self._body = open_page(self.cookie, self.url)
+            except Exception as e:
+                logger.exception(e)
+            return
 
         is_exist = ""
-        for _ in range(3):
-            self.selector = handle_html(self.cookie, self.url)
-            info = self.selector.xpath("//div[@class='c']")
+        for i in range(3):
+            if i:
+                # 上一次取到的是空页面，可能被限制访问，降低请求速率后重试
+                metrics.inc("retries_total", kind="page")
+                http_util.penalize(self.url)
+            self.selector, changed = fetch_html(
+                self.cookie, self.url, parse_unchanged=i > 0 or not skip_unchanged
+            )
+            if i == 0 and not changed and skip_unchanged:
+                # 内容没变说明本页的微博上次都已处理过，不必解析，也不必再翻页
+                logger.info("Page %d unchanged since last refresh", page)
+                self.unchanged = True
+                self.to_continue = False
+                return
+            if self.selector is None:
+                continue
+            info = xpaths.FEED_ITEMS(self.selector)
             if info is None or len(info) == 0:
                 continue
-            is_exist = info[0].xpath("div/span[@class='ctt']")
+            is_exist = xpaths.CTT_SPANS(info[0])
             if is_exist:
-                self.empty_count = 0
                 break
         if not is_exist:
-            self.empty_count += 1
-        if self.empty_count > 2:
+            # 重试后仍是空页面(已到末页或被限制访问)，不再翻页
+            logger.info("Page %d has no weibos, stop paging", page)
             self.to_continue = False
-            self.empty_count = 0
-        self.filter = filter
 
-    def get_one_page(self, weibo_id_list: list):
-        """Get everything on the first page of my feed"""
-        try:
-            info = self.selector.xpath("//div[@class='c']")
-            is_exist = info[0].xpath("div/span[@class='ctt']")
-            weibos = []
-            if is_exist:
-                for i in range(len(info) - 1):
-                    weibo = self.get_one_weibo(info[i])
-                    if weibo:
-                        if weibo.id in weibo_id_list:
-                            continue
-                        publish_time = datetime_util.str_to_time(weibo.publish_time)
-
-                        # NOTE: debug begins
-                        # TODO: change this to debug level instead of info
-                        logger.info("~" * 100)
-                        logger.info("user_id = " + weibo.user_id)
-                        logger.info(weibo.id)
-                        logger.info(
-                            f'publish_time = {publish_time.strftime("%Y-%m-%d %H:%M:%S")} '
-                            + f'since_time = {self.since_time.strftime("%Y-%m-%d %H:%M:%S")}'
-                        )
-                        logger.info("~" * 100)
-                        # NOTE: debug ends
-
-                        if publish_time < self.since_time - timedelta(minutes=1):
-                            logger.info(
-                                "Publish_time earlier than since_time, returning..."
-                            )
-                            logger.info(f"fetched {len(weibos)} wbs")
-                            return weibos, weibo_id_list, False
-                        logger.info("\n" + str(weibo))
-                        logger.info("-" * 100)
-                        weibos.append(weibo)
-                        weibo_id_list.append(weibo.id)
+    def _iter_stream(self):
+        """流式解析时边读边产出条目，读到下一个div.c才产出上一个，最后一个div.c为翻页栏"""
+        body, self._body = self._body, None
+        for i in range(3):
+            if i:
+                # 上一次取到的是空页面，可能被限制访问，降低请求速率后重试
+                metrics.inc("retries_total", kind="page")
+                http_util.penalize(self.url)
+            try:
+                stream = iter_items(self.cookie, self.url, body=body)
+                body = None
+                previous = next(stream, None)
+            except Exception as e:
+                logger.exception(e)
+                continue
+            if previous is not None and xpaths.CTT_SPANS(previous):
+                break
+            stream.close()
+        else:
+            # 取不到微博时不再翻页
+            self.to_continue = False
+            return
+        for node in stream:
+            self.item_count += 1
+            yield FeedItem(previous)
+            previous = node
 
+    def get_feed_items(self):
+        """本页的全部微博条目，最后一个div.c为翻页栏，不包含在内
+
+        流式解析时返回生成器，条目在迭代时才从响应中读取和解析
+        """
+        if self.streaming:
+            return self._iter_stream()
+        if self.unchanged or self.selector is None:
+            return []
+        info = xpaths.FEED_ITEMS(self.selector)
+        if not info or not xpaths.CTT_SPANS(info[0]):
+            return []
+        items = [FeedItem(node) for node in info[:-1]]
+        self.item_count = len(items)
+        return items
+
+    def get_one_page(self, seen):
+        """Get everything on this page of my feed
+
+        seen is a SeenIndex; reaching a weibo fetched in an earlier refresh means
+        the rest of the feed has been fetched before, so paging stops there.
+        """
+        try:
+            parsed = []
+            to_continue = self.to_continue
+            items = iter(self.get_feed_items())
+            for item in items:
+                if item.id in seen:
+                    if seen.seen_before_refresh(item.id):
+                        logger.info("Reached weibos fetched last refresh, returning...")
+                        to_continue = False
+                        break
+                    continue
+                weibo, tasks = self.parse_one_weibo(item)
+                if weibo:
+                    publish_time = datetime_util.str_to_time(weibo.publish_time)
+
+                    # NOTE: debug begins
+                    # TODO: change this to debug level instead of info
+                    logger.info("~" * 100)
+                    logger.info("user_id = " + weibo.user_id)
+                    logger.info(weibo.id)
+                    logger.info(
+                        f'publish_time = {publish_time.strftime("%Y-%m-%d %H:%M:%S")} '
+                        + f'since_time = {self.since_time.strftime("%Y-%m-%d %H:%M:%S")}'
+                    )
+                    logger.info("~" * 100)
+                    # NOTE: debug ends
+
+                    if publish_time < self.since_time - timedelta(minutes=1):
+                        logger.info("Publish_time earlier than since_time, returning...")
+                        to_continue = False
+                        break
+                    parsed.append((weibo, tasks))
+                    seen.add_pending(weibo.id, publish_time)
+            # 流式解析时读完本页剩余的条目，使item_count为本页的条目数
+            for _ in items:
+                pass
+            to_continue = to_continue and self.to_continue
+
+            weibos = self.enrich_weibos(parsed)
+            for weibo in weibos:
+                logger.info("\n" + str(weibo))
+                logger.info("-" * 100)
             logger.info(f"fetched {len(weibos)} wbs")
-            return weibos, weibo_id_list, self.to_continue
+            return weibos, seen, to_continue
 
         except Exception as e:
             logger.exception(e)
 
-    def is_original(self, info):
+    def select_new_items(self, seen):
+        """只做本地解析，挑出本页中未爬取过且发布时间不早于since_time的条目，
+        供异步引擎并发获取完整信息"""
+        try:
+            items = []
+            to_continue = self.to_continue
+            feed_items = iter(self.get_feed_items())
+            for item in feed_items:
+                if self.filter and not self.is_original(item):
+                    continue
+                if item.id in seen:
+                    if seen.seen_before_refresh(item.id):
+                        to_continue = False
+                        break
+                    continue
+                publish_time = datetime_util.str_to_time(self.get_publish_time(item))
+                if publish_time < self.since_time - timedelta(minutes=1):
+                    to_continue = False
+                    break
+                items.append(item)
+                seen.add_pending(item.id, publish_time)
+            for _ in feed_items:
+                pass
+            return items, to_continue and self.to_continue
+        except Exception as e:
+            logger.exception(e)
+            return [], False
+
+    def is_original(self, item):
         """判断微博是否为原创微博"""
-        is_original = info.xpath("div/span[@class='cmt']")
-        if len(is_original) > 3:
+        if len(item.cmt_spans) > 3:
             return False
         else:
             return True
 
-    def get_original_weibo(self, info, weibo_id):
+    def get_original_weibo(self, item, fetch=True):
         """获取原创微博
         Feed中原创微博的格式：
             <USER>
@@ -96,23 +253,22 @@ class PageParser(Parser):
             赞[0] 转发[0] 评论[0] 收藏 ...
         """
         try:
-            weibo_content = handle_garbled(info)
+            weibo_content = item.text
 
             # 过滤 “<USER>:” 与 “赞[0] 转发[0] 评论[0] 收藏 ...” 部分
             weibo_content = weibo_content[
                 weibo_content.find(":") + 1 : weibo_content.rfind("赞")
             ]
 
-            a_text = info.xpath("div//a/text()")
-            if "全文" in a_text:
-                wb_content = CommentParser(self.cookie, weibo_id).get_long_weibo()
+            if fetch and "全文" in item.link_texts:
+                wb_content = CommentParser(self.cookie, item.id).get_long_weibo()
                 if wb_content:
                     weibo_content = wb_content
             return weibo_content
         except Exception as e:
             logger.exception(e)
 
-    def get_retweet(self, info, weibo_id):
+    def get_retweet(self, item, fetch=True):
         """获取转发微博
         Feed中转发微博的格式：
             <USER>转发了<USER>的微博:
@@ -123,7 +279,7 @@ class PageParser(Parser):
             赞[0] 转发[0] 评论[0] 收藏 ...
         """
         try:
-            weibo_content = handle_garbled(info)
+            weibo_content = item.text
 
             # 过滤 “<USER>转发了<USER>的微博:” 与 “赞[0] 转发[0] 评论[0] 收藏 ...” 部分
             weibo_content = weibo_content[
@@ -133,14 +289,15 @@ class PageParser(Parser):
             # 过滤 “赞[0] 原文转发[0] 原文评论[0] 转发理由:” 及之后的部分
             weibo_content = weibo_content[: weibo_content.rfind("赞")]
 
-            a_text = info.xpath("div//a/text()")
-            if "全文" in a_text:
-                wb_content = CommentParser(self.cookie, weibo_id).get_long_retweet()
+            if fetch and "全文" in item.link_texts:
+                wb_content = CommentParser(self.cookie, item.id).get_long_retweet()
                 if wb_content:
                     weibo_content = wb_content
-            retweet_reason = handle_garbled(info.xpath("div")[-1])
+            retweet_reason = item.last_div_text
             retweet_reason = retweet_reason[: retweet_reason.rindex("赞")]
-            original_user = info.xpath("div/span[@class='cmt']/a/text()")
+            original_user = [
+                a.text for span in item.cmt_spans for a in span.iterchildren("a")
+            ]
             if original_user:
                 original_user = original_user[0]
                 weibo_content = (
@@ -158,62 +315,64 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def get_weibo_content(self, info, is_original):
-        """获取微博内容"""
+    @metrics.timed("extract", field="content")
+    def get_weibo_content(self, item, is_original, fetch=True):
+        """获取微博内容，fetch为False时不请求全文，只取Feed中截断的内容"""
         try:
-            weibo_id = info.xpath("@id")[0][2:]
             if is_original:
-                weibo_content = self.get_original_weibo(info, weibo_id)
+                weibo_content = self.get_original_weibo(item, fetch)
             else:
-                weibo_content = self.get_retweet(info, weibo_id)
+                weibo_content = self.get_retweet(item, fetch)
             return weibo_content
         except Exception as e:
             logger.exception(e)
 
-    def get_article_url(self, info):
+    @metrics.timed("extract", field="article_url")
+    def get_article_url(self, item):
         """获取微博头条文章的url"""
         article_url = ""
-        text = handle_garbled(info)
-        if text.startswith("发布了头条文章"):
-            url = info.xpath(".//a/@href")
+        if item.text.startswith("发布了头条文章"):
+            url = [a.get("href") for a in item.links if a.get("href") is not None]
             if url and url[0].startswith("https://weibo.cn/sinaurl"):
                 article_url = url[0]
         return article_url
 
-    def get_publish_place(self, info):
+    @metrics.timed("extract", field="publish_place")
+    def get_publish_place(self, item):
         """获取微博发布位置"""
         try:
-            div_first = info.xpath("div")[0]
-            a_list = div_first.xpath("a")
+            div_first = item.divs[0]
             publish_place = "无"
-            for a in a_list:
+            for a in div_first.iterchildren("a"):
                 if (
-                    "place.weibo.com" in a.xpath("@href")[0]
-                    and a.xpath("text()")[0] == "显示地图"
+                    "place.weibo.com" in a.get("href", "")
+                    and a.text == "显示地图"
                 ):
-                    weibo_a = div_first.xpath("span[@class='ctt']/a")
+                    weibo_a = [
+                        link
+                        for span in div_first.iterchildren("span")
+                        if span.get("class") == "ctt"
+                        for link in span.iterchildren("a")
+                    ]
                     if len(weibo_a) >= 1:
                         publish_place = weibo_a[-1]
-                        if (
-                            "视频"
-                            == div_first.xpath("span[@class='ctt']/a/text()")[-1][-2:]
-                        ):
+                        if "视频" == (weibo_a[-1].text or "")[-2:]:
                             if len(weibo_a) >= 2:
                                 publish_place = weibo_a[-2]
                             else:
                                 publish_place = "无"
-                        publish_place = handle_garbled(publish_place)
+                        if publish_place != "无":
+                            publish_place = handle_garbled(publish_place)
                         break
             return publish_place
         except Exception as e:
             logger.exception(e)
 
-    def get_publish_time(self, info):
+    @metrics.timed("extract", field="publish_time")
+    def get_publish_time(self, item):
         """获取微博发布时间"""
         try:
-            str_time = info.xpath("div/span[@class='ct']")
-            str_time = handle_garbled(str_time[0])
-            publish_time = str_time.split("来自")[0]
+            publish_time = item.ct_text.split("来自")[0]
             if "刚刚" in publish_time:
                 publish_time = datetime.now().strftime("%Y-%m-%d %H:%M")
             elif "分钟" in publish_time:
@@ -238,11 +397,11 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def get_publish_tool(self, info):
+    @metrics.timed("extract", field="publish_tool")
+    def get_publish_tool(self, item):
         """获取微博发布工具"""
         try:
-            str_time = info.xpath("div/span[@class='ct']")
-            str_time = handle_garbled(str_time[0])
+            str_time = item.ct_text
             if len(str_time.split("来自")) > 1:
                 publish_tool = str_time.split("来自")[1]
             else:
@@ -251,15 +410,14 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def get_weibo_footer(self, info):
+    @metrics.timed("extract", field="footer")
+    def get_weibo_footer(self, item):
         """获取微博点赞数、转发数、评论数"""
         try:
             footer = {}
-            pattern = r"\d+"
-            str_footer = info.xpath("div")[-1]
-            str_footer = handle_garbled(str_footer)
+            str_footer = item.last_div_text
             str_footer = str_footer[str_footer.rfind("赞") :]
-            weibo_footer = re.findall(pattern, str_footer, re.M)
+            weibo_footer = xpaths.NUMBER.findall(str_footer)
 
             up_num = int(weibo_footer[0])
             footer["up_num"] = up_num
@@ -273,50 +431,49 @@ class PageParser(Parser):
         except Exception as e:
             logger.exception(e)
 
-    def get_picture_urls(self, info, is_original):
-        """获取微博原始图片url"""
+    @metrics.timed("extract", field="pictures")
+    def get_picture_urls(self, item, is_original, fetch=True):
+        """获取微博原始图片url，fetch为False时组图只取第一张"""
         try:
-            weibo_id = info.xpath("@id")[0][2:]
             picture_urls = {}
             if is_original:
-                original_pictures = self.extract_picture_urls(info, weibo_id)
+                original_pictures = self.extract_picture_urls(item, item.id, fetch)
                 picture_urls["original_pictures"] = original_pictures
                 if not self.filter:
-                    picture_urls["retweet_pictures"] = "无"
+                    picture_urls["retweet_pictures"] = ()
             else:
-                retweet_url = info.xpath("div/a[@class='cc']/@href")[0]
+                retweet_url = [
+                    a.get("href") for a in item.div_links if a.get("class") == "cc"
+                ][0]
                 retweet_id = retweet_url.split("/")[-1].split("?")[0]
-                retweet_pictures = self.extract_picture_urls(info, retweet_id)
+                retweet_pictures = self.extract_picture_urls(item, retweet_id, fetch)
                 picture_urls["retweet_pictures"] = retweet_pictures
-                a_list = info.xpath("div[last()]/a/@href")
-                original_picture = "无"
-                for a in a_list:
-                    if a.endswith((".gif", ".jpeg", ".jpg", ".png")):
-                        original_picture = a
+                original_picture = ()
+                for a in item.divs[-1].iterchildren("a"):
+                    if a.get("href", "").endswith((".gif", ".jpeg", ".jpg", ".png")):
+                        original_picture = (a.get("href"),)
                         break
                 picture_urls["original_pictures"] = original_picture
             return picture_urls
         except Exception as e:
             logger.exception(e)
 
-    def get_video_url(self, info):
+    @metrics.timed("extract", field="video_url")
+    def get_video_url(self, item):
         """获取微博视频url"""
         video_url = "无"
 
-        weibo_id = info.xpath("@id")[0][2:]
         try:
             video_page_url = ""
-            a_text = info.xpath("./div[1]//a/text()")
-            if "全文" in a_text:
+            if "全文" in [a.text for a in item.first_div_links]:
                 video_page_url = CommentParser(
-                    self.cookie, weibo_id
+                    self.cookie, item.id
                 ).get_video_page_url()
             else:
                 # 来自微博视频号的格式与普通格式不一致，不加 span 层级
-                a_list = info.xpath("./div[1]//a")
-                for a in a_list:
-                    if "m.weibo.cn/s/video/show?object_id=" in a.xpath("@href")[0]:
-                        video_page_url = a.xpath("@href")[0]
+                for a in item.first_div_links:
+                    if "m.weibo.cn/s/video/show?object_id=" in a.get("href", ""):
+                        video_page_url = a.get("href")
                         break
 
             if video_page_url != "":
@@ -326,72 +483,146 @@ class PageParser(Parser):
 
         return video_url
 
-    def get_weibo_user_id(self, info):
+    @metrics.timed("extract", field="user_id")
+    def get_weibo_user_id(self, item):
         """Get the id of the user who posted this wb"""
         try:
-            user_id = info.xpath("./div/a[@class='nk']/@href")[0].split("/")[-1]
+            user_id = item.user_href.split("/")[-1]
         except Exception as e:
             logger.exception(e)
 
         return user_id
 
-    def get_one_weibo(self, info) -> Weibo:
-        """获取一条微博的全部信息"""
+    def parse_one_weibo(self, item: FeedItem) -> tuple[Weibo, list]:
+        """只用本地解析获取一条微博的信息，返回 (weibo, 补全任务列表)
+
+        长微博、组图与视频链接先取Feed中能直接得到的内容，需要额外请求的部分作为补全任务返回，
+        每个任务返回 {字段名: 值}
+        """
         try:
             weibo = Weibo()
-            is_original = self.is_original(info)
+            is_original = self.is_original(item)
             weibo.original = is_original  # 是否原创微博
             if (not self.filter) or is_original:
-                weibo.id = info.xpath("@id")[0][2:]
-                weibo.user_id = self.get_weibo_user_id(info)
-                weibo.content = self.get_weibo_content(info, is_original)  # 微博内容
-                weibo.article_url = self.get_article_url(info)  # 头条文章url
-                picture_urls = self.get_picture_urls(info, is_original)
+                weibo.id = item.id
+                weibo.user_id = self.get_weibo_user_id(item)
+                weibo.content = self.get_weibo_content(item, is_original, False)  # 微博内容
+                weibo.article_url = self.get_article_url(item)  # 头条文章url
+                picture_urls = self.get_picture_urls(item, is_original, False)
                 weibo.original_pictures = picture_urls["original_pictures"]  # 原创图片url
                 if not self.filter:
                     weibo.retweet_pictures = picture_urls["retweet_pictures"]  # 转发图片url
-                weibo.video_url = self.get_video_url(info)  # 微博视频url
-                weibo.publish_place = self.get_publish_place(info)  # 微博发布位置
-                weibo.publish_time = self.get_publish_time(info)  # 微博发布时间
-                weibo.publish_tool = self.get_publish_tool(info)  # 微博发布工具
-                footer = self.get_weibo_footer(info)
+                weibo.video_url = "无"  # 微博视频url
+                weibo.publish_place = self.get_publish_place(item)  # 微博发布位置
+                weibo.publish_time = self.get_publish_time(item)  # 微博发布时间
+                weibo.publish_tool = self.get_publish_tool(item)  # 微博发布工具
+                footer = self.get_weibo_footer(item)
                 weibo.up_num = footer["up_num"]  # 微博点赞数
                 weibo.retweet_num = footer["retweet_num"]  # 转发数
                 weibo.comment_num = footer["comment_num"]  # 评论数
-            else:
-                weibo = None
-                logger.info("正在过滤转发微博")
-            return weibo
+                return weibo, self.get_enrich_tasks(item, is_original)
+            logger.info("正在过滤转发微博")
         except Exception as e:
             logger.exception(e)
-
-    def extract_picture_urls(self, info, weibo_id):
-        """提取微博原始图片url"""
+        return None, []
+
+    def get_enrich_tasks(self, item, is_original):
+        """需要额外请求才能获取的字段"""
+        tasks = []
+        if "全文" in item.link_texts:
+            tasks.append(
+                lambda: {"content": self.get_weibo_content(item, is_original)}
+            )
+        if "https://weibo.cn/mblog/picAll/" in "".join(item.div_hrefs):
+            tasks.append(lambda: self.get_picture_urls(item, is_original) or {})
+        if "全文" in [a.text for a in item.first_div_links] or any(
+            "m.weibo.cn/s/video/show?object_id=" in a.get("href", "")
+            for a in item.first_div_links
+        ):
+            tasks.append(lambda: {"video_url": self.get_video_url(item)})
+        return tasks
+
+    @staticmethod
+    def apply_enrichment(weibo, fields):
+        """用补全任务的结果覆盖本地解析的字段，取不到的字段保持不变"""
+        for name, value in fields.items():
+            if value:
+                setattr(weibo, name, value)
+
+    def enrich_weibos(self, parsed):
+        """在共享线程池中并发执行parsed [(weibo, tasks)] 的补全任务，返回weibo列表
+
+        每个任务从开始执行起最多等待timeout秒，在线程池中排队的时间不计入；
+        整页另有按任务数与线程数估算的总时限，超时或出错的任务保留本地解析的结果
+        """
+        executor = _get_enrich_executor()
+        timeout = _enrich_config["timeout"]
+        timed_tasks = [
+            (weibo, _TimedTask(task)) for weibo, tasks in parsed for task in tasks
+        ]
+        futures = [
+            (weibo, task, executor.submit(task)) for weibo, task in timed_tasks
+        ]
+        rounds = -(-len(futures) // _enrich_config["workers"])
+        page_deadline = time.monotonic() + timeout * (rounds + 1)
+        for weibo, task, future in futures:
+            while True:
+                now = time.monotonic()
+                deadline = page_deadline
+                if task.started is not None:
+                    deadline = min(deadline, task.started + timeout)
+                try:
+                    fields = future.result(max(0, min(deadline - now, timeout)))
+                    self.apply_enrichment(weibo, fields)
+                except TimeoutError:
+                    if time.monotonic() < deadline:
+                        continue  # 还在排队，或开始执行后未满timeout秒
+                    future.cancel()
+                    logger.warning("补全微博%s超时，使用Feed中的内容", weibo.id)
+                except Exception as e:
+                    logger.exception(e)
+                break
+        return [weibo for weibo, _ in parsed]
+
+    def get_one_weibo(self, item: FeedItem) -> Weibo:
+        """获取一条微博的全部信息，补全任务在当前线程中依次执行"""
+        weibo, tasks = self.parse_one_weibo(item)
+        for task in tasks:
+            try:
+                self.apply_enrichment(weibo, task())
+            except Exception as e:
+                logger.exception(e)
+        return weibo
+
+    def extract_picture_urls(self, item, weibo_id, fetch=True):
+        """提取微博原始图片url，返回tuple"""
         try:
-            a_list = info.xpath("div/a/@href")
+            a_list = "".join(item.div_hrefs)
             first_pic = "https://weibo.cn/mblog/pic/" + weibo_id
             all_pic = "https://weibo.cn/mblog/picAll/" + weibo_id
-            picture_urls = "无"
-            if first_pic in "".join(a_list):
-                if all_pic in "".join(a_list):
+            picture_urls = ()
+            if first_pic in a_list:
+                if fetch and all_pic in a_list:
                     preview_picture_list = MblogPicAllParser(
                         self.cookie, weibo_id
                     ).extract_preview_picture_list()
-                    picture_list = [
+                    picture_urls = tuple(
                         p.replace("/thumb180/", "/large/") for p in preview_picture_list
-                    ]
-                    picture_urls = ",".join(picture_list)
+                    )
                 else:
-                    if info.xpath(".//img/@src"):
-                        for link in info.xpath("div/a"):
-                            if len(link.xpath("@href")) > 0:
-                                if first_pic in link.xpath("@href")[0]:
-                                    if len(link.xpath("img/@src")) > 0:
-                                        preview_picture = link.xpath("img/@src")[0]
-                                        picture_urls = preview_picture.replace(
-                                            "/wap180/", "/large/"
-                                        )
-                                        break
+                    if item.has_img:
+                        for link in item.div_links:
+                            if first_pic in link.get("href", ""):
+                                preview_picture = [
+                                    img.get("src")
+                                    for img in link.iterchildren("img")
+                                    if img.get("src") is not None
+                                ]
+                                if preview_picture:
+                                    picture_urls = (
+                                        preview_picture[0].replace("/wap180/", "/large/"),
+                                    )
+                                    break
                     else:
                         logger.warning(
                             '爬虫微博可能被设置成了"不显示图片"，请前往'
@@ -401,4 +632,4 @@ class PageParser(Parser):
             return picture_urls
         except Exception as e:
             logger.exception(e)
-            return "无"
+            return ()
@@ -1,10 +1,19 @@
 import hashlib
+import io
 import json
 import logging
+import os
 import sys
+import time
 
 import requests
 from lxml import etree
+from requests.adapters import BaseAdapter
+
+from .. import metrics
+from ..http_util import get_session
+from ..response_cache import StreamedBody, get_cache, url_kind
+from . import xpaths
 
 # Set GENERATE_TEST_DATA to True when generating test data.
 GENERATE_TEST_DATA = False
@@ -12,49 +21,188 @@ TEST_DATA_DIR = "tests/testdata"
 URL_MAP_FILE = "url_map.json"
 logger = logging.getLogger("spider.util")
 
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36"
+
+# 流式解析：feed页与评论页边接收边解析，每个div.c闭合后立即交给解析器
+_stream_config = {"enabled": 0, "chunk_size": 16 * 1024}
+
+
+def configure_streaming(stream_config=None):
+    """设置是否流式解析(enabled)以及每次从响应中读取的字节数(chunk_size)"""
+    _stream_config.update(stream_config or {})
+
+
+def streaming_enabled():
+    return bool(_stream_config["enabled"])
+
 
 def hash_url(url):
     return hashlib.sha224(url.encode("utf8")).hexdigest()
 
 
-def handle_html(cookie, url):
-    """处理html"""
+def record_test_data(url, resp):
+    """把响应保存到TEST_DATA_DIR，并在url_map.json中记录url对应的文件"""
+    if not os.path.isdir(TEST_DATA_DIR):
+        os.makedirs(TEST_DATA_DIR)
+    resp_file = os.path.join(TEST_DATA_DIR, "%s.html" % hash_url(url))
+    with io.open(resp_file, "w", encoding="utf-8") as f:
+        f.write(resp.text)
+
+    url_map_path = os.path.join(TEST_DATA_DIR, URL_MAP_FILE)
+    if not os.path.isfile(url_map_path):
+        with io.open(url_map_path, "w") as f:
+            f.write("{}")
+    with io.open(url_map_path, "r+") as f:
+        url_map = json.loads(f.read())
+        url_map[url] = resp_file
+        f.seek(0)
+        f.write(json.dumps(url_map, indent=4, ensure_ascii=False))
+        f.truncate()
+
+
+class ReplayAdapter(BaseAdapter):
+    """用录制的测试数据代替网络请求，按url的哈希在data_dir中查找响应，找不到时返回404"""
+
+    def __init__(self, data_dir=TEST_DATA_DIR):
+        super().__init__()
+        self.data_dir = data_dir
+
+    def send(self, request, **kwargs):
+        resp = requests.Response()
+        resp.url = request.url
+        resp.request = request
+        resp.encoding = "utf-8"
+        resp_file = os.path.join(self.data_dir, "%s.html" % hash_url(request.url))
+        content = b""
+        resp.status_code = 404
+        if os.path.isfile(resp_file):
+            with open(resp_file, "rb") as f:
+                content = f.read()
+            resp.status_code = 200
+        # 与真实响应一样从raw读取，stream=True时可以分块读取
+        resp.raw = io.BytesIO(content)
+        resp.headers["Content-Length"] = str(len(content))
+        return resp
+
+    def close(self):
+        pass
+
+
+def fetch_html(cookie, url, parse_unchanged=True):
+    """经过响应缓存获取页面，返回 (selector, 内容是否与上一次不同)
+
+    parse_unchanged为False时，内容与上一次相同的页面不再解析，selector为None
+    """
+    kind = url_kind(url)
+    with metrics.span("fetch", kind=kind):
+        return _fetch_html(cookie, url, parse_unchanged, kind)
+
+
+def _fetch_html(cookie, url, parse_unchanged, kind):
     try:
-        user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36"
-        headers = {"User_Agent": user_agent, "Cookie": cookie}
-        resp = requests.get(url, headers=headers)
+        headers = {"User_Agent": USER_AGENT, "Cookie": cookie}
+        cache = get_cache()
+        if cache is None:
+            resp = get_session().get(url, headers=headers)
+            content, changed = resp.content, True
+        else:
+            content, changed, resp = cache.fetch(
+                get_session(), url, headers, _cache_key(cookie, url)
+            )
 
-        if GENERATE_TEST_DATA:
-            import io
-            import os
-
-            resp_file = os.path.join(TEST_DATA_DIR, "%s.html" % hash_url(url))
-            with io.open(resp_file, "w", encoding="utf-8") as f:
-                f.write(resp.text)
-
-            with io.open(os.path.join(TEST_DATA_DIR, URL_MAP_FILE), "r+") as f:
-                url_map = json.loads(f.read())
-                url_map[url] = resp_file
-                f.seek(0)
-                f.write(json.dumps(url_map, indent=4, ensure_ascii=False))
-                f.truncate()
-
-        selector = etree.HTML(resp.content)
-        return selector
+        if resp is not None and resp.status_code != 304:
+            metrics.inc("page_bytes_total", len(content), kind=kind)
+            if GENERATE_TEST_DATA:
+                record_test_data(url, resp)
+
+        if not changed and not parse_unchanged:
+            return None, False
+        return etree.HTML(content), changed
     except Exception as e:
         logger.exception(e)
+        return None, True
+
+
+def _cache_key(cookie, url):
+    # 同一url对不同账号返回的内容不同，缓存键包含cookie
+    return hashlib.sha1(cookie.encode("utf8")).hexdigest() + " " + url
+
+
+def open_page(cookie, url):
+    """流式获取页面：只发出请求，返回StreamedBody，响应体在iter_items中边读边解析"""
+    headers = {"User_Agent": USER_AGENT, "Cookie": cookie}
+    chunk_size = _stream_config["chunk_size"]
+    cache = get_cache()
+    if cache is None:
+        resp = get_session().get(url, headers=headers, stream=True)
+        return StreamedBody(resp.iter_content(chunk_size), resp)
+    return cache.open(
+        get_session(), url, headers, _cache_key(cookie, url), chunk_size
+    )[0]
+
+
+def iter_items(cookie, url, limit=None, body=None):
+    """流式获取页面，边接收边用HTMLPullParser解析，每个div.c闭合时立即产出
+
+    产出一个div.c前先从树中删去它之前的兄弟节点，树中只保留正在处理的条目，
+    调用者不再引用的条目随即释放。limit为最多产出的条目数，之后停止解析；
+    页面需要进缓存时仍读完剩余的响应体。
+    body为open_page已经打开的响应体；lxml的解析器不能跨线程使用，可以在别的线程中open_page，
+    但必须在同一个线程中迭代。
+    """
+    kind = url_kind(url)
+    if body is None:
+        body = open_page(cookie, url)
+    resp = body.resp
+    parser = etree.HTMLPullParser(events=("end",), tag="div")
+    started = time.perf_counter()
+    count = 0
+    try:
+        chunks = iter(body)
+        while limit is None or count < limit:
+            chunk = next(chunks, None)
+            if chunk is None:
+                if not body.size:
+                    break  # 空页面
+                parser.close()
+            else:
+                parser.feed(chunk)
+            for _, elem in parser.read_events():
+                if elem.get("class") != "c":
+                    continue
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+                if not count:
+                    metrics.observe("first_item", time.perf_counter() - started, kind=kind)
+                count += 1
+                yield elem
+                if count == limit:
+                    break
+            if chunk is None:
+                break
+        if body.keep_body:
+            body.drain()
+    finally:
+        body.close()
+        if resp is not None and resp.status_code != 304:
+            metrics.inc("page_bytes_total", body.size, kind=kind)
+
+
+def handle_html(cookie, url):
+    """处理html"""
+    return fetch_html(cookie, url)[0]
+
+
+def clean_text(text):
+    """去掉零宽空格及当前终端编码无法表示的字符"""
+    encoding = sys.stdout.encoding
+    return text.replace("\u200b", "").encode(encoding, "ignore").decode(encoding)
 
 
 def handle_garbled(info):
     """处理乱码"""
     try:
-        info = (
-            info.xpath("string(.)")
-            .replace("\u200b", "")
-            .encode(sys.stdout.encoding, "ignore")
-            .decode(sys.stdout.encoding)
-        )
-        return info
+        return clean_text(xpaths.TEXT(info))
     except Exception as e:
         logger.exception(e)
         return "无"
@@ -97,7 +245,10 @@ def to_video_download_url(cookie, video_page_url):
     try:
         user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36"
         headers = {"User_Agent": user_agent, "Cookie": cookie}
-        wb_info = requests.get(video_object_url, headers=headers).json()
+        resp = get_session().get(video_object_url, headers=headers)
+        if GENERATE_TEST_DATA:
+            record_test_data(video_object_url, resp)
+        wb_info = resp.json()
         video_url = wb_info["data"]["object"]["stream"].get("hd_url")
         if not video_url:
             video_url = wb_info["data"]["object"]["stream"]["url"]
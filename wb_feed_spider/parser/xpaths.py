@@ -0,0 +1,42 @@
+"""各解析器用到的XPath与正则表达式，导入时编译一次
+
+element.xpath("...")每次调用都要重新编译表达式，这里的etree.XPath对象可以直接调用:
+
+    items = xpaths.FEED_ITEMS(selector)
+    basic_info = xpaths.INFO_SECTION_TEXT(selector, n=3)
+"""
+import re
+
+from lxml import etree
+
+# 通用
+TEXT = etree.XPath("string(.)")  # 节点下的全部文本
+HREF = etree.XPath("@href")
+
+# PageParser
+FEED_ITEMS = etree.XPath("//div[@class='c']")
+CTT_SPANS = etree.XPath("div/span[@class='ctt']")
+NUMBER = re.compile(r"\d+", re.M)  # 点赞、转发、评论数
+
+# CommentParser
+WEIBO_TIME = etree.XPath("//span[@class='ct']/text()")
+VIDEO_LINKS = etree.XPath("body/div[@class='c' and @id][1]/div//a")
+
+# IndexParser
+USER_LINKS = etree.XPath("//div[@class='u']//a")
+USER_COUNTS = etree.XPath("//div[@class='tip2']/*/text()")
+PAGE_NUM_INPUTS = etree.XPath("//input[@name='mp']")
+
+# InfoParser，n为第几个div.c或div.tip
+TITLE = etree.XPath("//title/text()")
+INFO_SECTION_TEXT = etree.XPath("//div[@class='c'][$n]/text()")
+INFO_TIP_TEXT = etree.XPath("//div[@class='tip'][$n]/text()")
+
+# AlbumParser
+ALBUM_PICTURES = etree.XPath('//div[@class="c"]//img/@src')
+
+# PhotoParser
+AVATAR_ALBUM_HREF = etree.XPath('//img[@alt="头像相册"]/../@href')
+
+# MblogPicAllParser
+IMAGE_SRCS = etree.XPath("//img/@src")
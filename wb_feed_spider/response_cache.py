@@ -0,0 +1,277 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+logger = logging.getLogger("spider.response_cache")
+
+# 各类页面的名称、url模式与默认缓存时间(秒)：0表示不缓存(只做内容变化检测)，None表示永不过期
+URL_PATTERNS = [
+    ("feed", re.compile(r"^https://weibo\.cn/(\?page=\d+)?$"), 0),
+    ("picAll", re.compile(r"^https://weibo\.cn/mblog/picAll/"), None),
+    ("comment", re.compile(r"^https://weibo\.cn/comment/"), 600),
+    ("info", re.compile(r"^https://weibo\.cn/[^/?]+/info$"), 24 * 3600),
+    ("index", re.compile(r"^https://weibo\.cn/[^/?]+$"), 3600),
+]
+
+# 各类页面正常时必有的内容；反爬、登录等页面同样是200，没有这些内容的响应体不缓存
+PAGE_MARKERS = {
+    "feed": re.compile(rb"""class=["']c["']"""),
+    "comment": re.compile(rb"""class=["']c["']"""),
+    "info": re.compile(rb"""class=["']c["']"""),
+    "index": re.compile(rb"""class=["']tip2["']"""),
+    "picAll": re.compile(rb"<img"),
+}
+
+
+def url_kind(url):
+    """url对应的页面类型(URL_PATTERNS中的名称)，都不匹配时返回other"""
+    for name, pattern, _ in URL_PATTERNS:
+        if pattern.match(url):
+            return name
+    return "other"
+
+
+class CacheEntry:
+    __slots__ = ("body", "body_hash", "etag", "last_modified", "fetched_at")
+
+    @property
+    def size(self):
+        return len(self.body) if self.body is not None else 0
+
+    def __init__(self, body, body_hash, etag, last_modified, fetched_at):
+        self.body = body
+        self.body_hash = body_hash
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+
+class ResponseCache:
+    """handle_html前的响应缓存
+
+    未过期的页面直接返回缓存内容；过期后若服务器给过ETag/Last-Modified则发条件请求，
+    304时沿用缓存。每个url都记录响应体的哈希，用来判断内容相对上一次是否变化。
+    缓存的url数超过max_entries或响应体总字节数超过max_bytes时淘汰最久未用的。
+    """
+
+    def __init__(self, max_entries=2000, ttls=None, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.patterns = [
+            (pattern, (ttls or {}).get(name, ttl), PAGE_MARKERS.get(name))
+            for name, pattern, ttl in URL_PATTERNS
+        ]
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _rule_for(self, url):
+        """返回 (缓存时间, 页面应有内容的正则)"""
+        for pattern, ttl, marker in self.patterns:
+            if pattern.match(url):
+                return ttl, marker
+        return 0, None
+
+    def _lookup(self, url, key, now):
+        """返回 (缓存时间, 缓存项, 未过期可直接使用的缓存项)"""
+        ttl = self._rule_for(url)[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            fresh = (
+                entry is not None
+                and entry.body is not None
+                and ttl != 0
+                and (ttl is None or now - entry.fetched_at < ttl)
+            )
+        if fresh:
+            metrics.inc("response_cache_total", result="hit")
+            return ttl, entry, entry
+        return ttl, entry, None
+
+    @staticmethod
+    def _conditional_headers(entry, headers):
+        headers = dict(headers)
+        if entry is not None and entry.body is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def _not_modified(self, entry, resp, now):
+        if resp.status_code == 304 and entry is not None and entry.body is not None:
+            with self._lock:
+                entry.fetched_at = now
+            metrics.inc("response_cache_total", result="not_modified")
+            return True
+        metrics.inc("response_cache_total", result="miss")
+        return False
+
+    @staticmethod
+    def _keep_body(ttl, resp):
+        # 不缓存的页面只保留哈希，除非能用条件请求复用；被重定向的(如跳转到登录页)不缓存
+        return (
+            resp.status_code == 200
+            and not resp.history
+            and bool(
+                ttl != 0
+                or resp.headers.get("ETag")
+                or resp.headers.get("Last-Modified")
+            )
+        )
+
+    def _valid_body(self, url, body):
+        """响应体是否为正常页面，而不是200的反爬、登录等页面"""
+        marker = self._rule_for(url)[1]
+        if marker is None or marker.search(body):
+            return True
+        metrics.inc("response_cache_total", result="invalid")
+        logger.warning("%s的内容不是正常页面，不缓存", url)
+        return False
+
+    def _store(self, key, url, ttl, entry, resp, body, body_hash, now):
+        """记录新的响应，返回内容是否与上一次不同"""
+        changed = entry is None or entry.body_hash != body_hash
+        if not (
+            body is not None
+            and self._keep_body(ttl, resp)
+            and self._valid_body(url, body)
+        ):
+            body = None
+        new_entry = CacheEntry(
+            body,
+            body_hash,
+            resp.headers.get("ETag") if body is not None else None,
+            resp.headers.get("Last-Modified") if body is not None else None,
+            now,
+        )
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._bytes -= old_entry.size
+            self._entries[key] = new_entry
+            self._bytes += new_entry.size
+            while len(self._entries) > self.max_entries or (
+                self._bytes > self.max_bytes and len(self._entries) > 1
+            ):
+                self._bytes -= self._entries.popitem(last=False)[1].size
+        return changed
+
+    def fetch(self, session, url, headers, key=None):
+        """返回 (响应体, 是否与上一次不同, 响应)，直接使用缓存时响应为None"""
+        key = key or url
+        now = time.monotonic()
+        ttl, entry, fresh = self._lookup(url, key, now)
+        if fresh is not None:
+            return fresh.body, False, None
+
+        resp = session.get(url, headers=self._conditional_headers(entry, headers))
+        if self._not_modified(entry, resp, now):
+            return entry.body, False, resp
+
+        body = resp.content
+        changed = self._store(
+            key, url, ttl, entry, resp, body, hashlib.sha1(body).digest(), now
+        )
+        return body, changed, resp
+
+    def open(self, session, url, headers, key=None, chunk_size=16 * 1024):
+        """与fetch相同，但未命中缓存时以stream=True请求，返回 (StreamedBody, 响应)
+
+        响应体读完后才更新缓存；直接使用缓存或304时StreamedBody只有一块
+        """
+        key = key or url
+        now = time.monotonic()
+        ttl, entry, fresh = self._lookup(url, key, now)
+        if fresh is not None:
+            return StreamedBody([fresh.body], changed=False), None
+
+        resp = session.get(
+            url, headers=self._conditional_headers(entry, headers), stream=True
+        )
+        if self._not_modified(entry, resp, now):
+            resp.close()
+            return StreamedBody([entry.body], changed=False), resp
+
+        def finish(body, body_hash):
+            return self._store(key, url, ttl, entry, resp, body, body_hash, now)
+
+        return (
+            StreamedBody(
+                resp.iter_content(chunk_size),
+                resp,
+                finish,
+                keep_body=self._keep_body(ttl, resp),
+            ),
+            resp,
+        )
+
+
+class StreamedBody:
+    """分块读取的响应体，迭代得到bytes块
+
+    读完后调用finish(响应体, 哈希)更新缓存，changed为内容是否与上一次不同，未读完时为None。
+    keep_body为True时说明完整的响应体要进缓存，提前停止解析时应调用drain()读完剩余部分。
+    """
+
+    def __init__(self, chunks, resp=None, finish=None, keep_body=False, changed=None):
+        self.resp = resp
+        self.keep_body = keep_body
+        self.changed = changed
+        self.size = 0
+        self._chunks = iter(chunks)
+        self._finish = finish
+        self._hash = hashlib.sha1()
+        self._parts = []
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            self.size += len(chunk)
+            if self._finish is not None:
+                self._hash.update(chunk)
+                if self.keep_body:
+                    self._parts.append(chunk)
+            yield chunk
+        if self._finish is not None:
+            body = b"".join(self._parts) if self.keep_body else None
+            self.changed = self._finish(body, self._hash.digest())
+            self._finish = None
+            self._parts = []
+
+    def drain(self):
+        """读完剩余的响应体，只计算哈希并更新缓存，不再交给解析器"""
+        for _ in self:
+            pass
+
+    def close(self):
+        if self.resp is not None:
+            self.resp.close()
+
+
+_cache = ResponseCache()
+
+
+def configure(cache_config=None):
+    """按配置重建缓存，enabled为0时关闭缓存"""
+    global _cache
+    cache_config = cache_config or {}
+    if not cache_config.get("enabled", 1):
+        _cache = None
+    else:
+        _cache = ResponseCache(
+            cache_config.get("max_entries", 2000),  # 最多缓存的url数
+            cache_config.get("ttl"),
+            cache_config.get("max_bytes", 64 * 1024 * 1024),  # 缓存响应体的总字节数上限
+        )
+
+
+def get_cache():
+    """当前的响应缓存，关闭时为None"""
+    return _cache
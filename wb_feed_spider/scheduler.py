@@ -0,0 +1,57 @@
+import logging
+import time
+
+logger = logging.getLogger("spider.scheduler")
+
+
+class AdaptiveScheduler:
+    """根据新微博的比例调整刷新间隔
+
+    第一页几乎全是新微博时(比例不低于busy_ratio)说明可能有微博被挤出第一页，间隔乘以tighten；
+    一条新微博都没有时间隔乘以backoff；间隔始终在[min_interval, max_interval]之内。
+    每次刷新的开始时间按单调时钟从上一次开始时间起算，爬取耗时不会累加到周期上。
+    """
+
+    def __init__(
+        self,
+        interval,
+        min_interval=None,
+        max_interval=None,
+        tighten=0.5,
+        backoff=1.5,
+        busy_ratio=0.8,
+    ):
+        self.min_interval = interval if min_interval is None else min_interval
+        self.max_interval = interval if max_interval is None else max_interval
+        self.interval = self._clamp(interval)
+        self.tighten = tighten
+        self.backoff = backoff
+        self.busy_ratio = busy_ratio
+        self._last_start = None
+
+    def _clamp(self, interval):
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def observe(self, new_count, page_size):
+        """根据上一次刷新第一页的新微博数(new_count)与条目数(page_size)调整间隔"""
+        if page_size <= 0:
+            return
+        if new_count / page_size >= self.busy_ratio:
+            interval = self._clamp(self.interval * self.tighten)
+        elif new_count == 0:
+            interval = self._clamp(self.interval * self.backoff)
+        else:
+            return
+        if interval != self.interval:
+            logger.info("刷新间隔调整为%.0f秒", interval)
+            self.interval = interval
+
+    def next_deadline(self):
+        """下一次刷新开始的单调时钟时刻"""
+        if self._last_start is None:
+            return time.monotonic() + self.interval
+        return self._last_start + self.interval
+
+    def start(self):
+        """记录本次刷新的开始时刻"""
+        self._last_start = time.monotonic()
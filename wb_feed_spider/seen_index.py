@@ -0,0 +1,116 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("spider.seen_index")
+
+
+class SeenIndex:
+    """持久化的已爬取微博id索引
+
+    id及首次爬取时间保存在sqlite文件中，启动时载入内存字典，判重为O(1)。
+    微博写入成功后才落盘。一轮刷新中选中但没有写入的微博(获取或写入失败)留到下一轮重试：
+    Spider把下一轮的since_time提前到其中最早的发布时间，这些微博重新出现之前，
+    已爬取的微博也不再作为翻页的边界。
+    超过max_age秒的id会被清除，数量超过max_size时清除最早的id。
+    """
+
+    def __init__(self, path="seen_index.db", max_age=3 * 24 * 3600, max_size=100000):
+        self.max_age = max_age
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS seen_seen_at ON seen (seen_at)"
+            )
+        self._refresh_started = time.time()
+        self._seen = {}
+        self._pending = {}  # 本轮选中、尚未写入的微博id -> 发布时间
+        self._retry = {}  # 上一轮没有写入、本轮还未重新选中的微博id -> 发布时间
+        self.expire()
+
+    def __contains__(self, weibo_id):
+        return weibo_id in self._seen or weibo_id in self._pending
+
+    def __len__(self):
+        return len(self._seen)
+
+    def add_pending(self, weibo_id, publish_time=None):
+        """本轮刷新中已选中、尚未写入的微博，只记在内存中，写入成功后再由add落盘"""
+        with self._lock:
+            self._pending[weibo_id] = publish_time
+            self._retry.pop(weibo_id, None)
+
+    def discard_pending(self, weibo_id):
+        """不再由本进程写入的微博(如已被其他分片认领)，不必重试"""
+        with self._lock:
+            self._pending.pop(weibo_id, None)
+
+    def oldest_pending(self):
+        """尚未写入的微博中最早的发布时间，没有时返回None"""
+        with self._lock:
+            times = [t for t in self._pending.values() if t is not None]
+        return min(times) if times else None
+
+    def retrying(self):
+        """本轮是否还有上一轮没有写入、尚未重新选中的微博"""
+        return bool(self._retry)
+
+    def add(self, *weibo_ids):
+        """记录已写入的微博，立即落盘"""
+        now = time.time()
+        with self._lock, self._conn:
+            new_ids = [i for i in weibo_ids if i not in self._seen]
+            for weibo_id in new_ids:
+                self._seen[weibo_id] = now
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO seen (id, seen_at) VALUES (?, ?)",
+                [(weibo_id, now) for weibo_id in new_ids],
+            )
+            for weibo_id in weibo_ids:
+                self._pending.pop(weibo_id, None)
+
+    def start_refresh(self):
+        """开始新一轮刷新，之前记录的id都视为上一轮的边界
+
+        上一轮未能写入的微博不算已爬取，本轮会重新获取。
+        """
+        self._refresh_started = time.time()
+        with self._lock:
+            self._retry, self._pending = self._pending, {}
+        self.expire()
+
+    def seen_before_refresh(self, weibo_id):
+        """该微博是否在本轮刷新之前就已爬取，是则说明已经与上一轮的结果衔接
+
+        还有待重试的微博时它们可能在更早的位置，返回False，由since_time决定何时停止翻页
+        """
+        seen_at = self._seen.get(weibo_id)
+        return (
+            seen_at is not None
+            and seen_at < self._refresh_started
+            and not self._retry
+        )
+
+    def expire(self):
+        """清除过期及超出数量上限的id"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM seen WHERE seen_at < ?", (time.time() - self.max_age,)
+            )
+            self._conn.execute(
+                "DELETE FROM seen WHERE id NOT IN "
+                "(SELECT id FROM seen ORDER BY seen_at DESC LIMIT ?)",
+                (self.max_size,),
+            )
+            self._seen = dict(self._conn.execute("SELECT id, seen_at FROM seen"))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,44 +1,101 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
-from datetime import datetime
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import json
 import logging
 import logging.config
 import os
 import shutil
+import signal
 import sys
 import time
-from typing import Generator
+from typing import TYPE_CHECKING, Generator
 
-from tqdm import tqdm
-from .downloader import AvatarPictureDownloader
 from .user import User
+from .seen_index import SeenIndex
+from .user_cache import UserCache
+from .write_queue import WriteBehindQueue
 from .weibo import Weibo
+from .scheduler import AdaptiveScheduler
+from . import config_util, http_util, metrics, response_cache
 
-from .parser import PageParser, AlbumParser, IndexParser, PhotoParser
-from . import config_util
+# 解析器(lxml)、下载器、tqdm与asyncio在用到时才导入，以缩短启动时间
+if TYPE_CHECKING:
+    from .parser import PageParser
 
 logging_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + "logging.conf"
-logging.config.fileConfig(logging_path)
 logger = logging.getLogger("spider")
 
 
+def setup_logging():
+    """按logging.conf配置日志，由main()在启动时调用"""
+    logging.config.fileConfig(logging_path)
+
+
+def configure_process(config: dict):
+    """按config设置进程内共享的状态(键见config_util.PROCESS_CONFIG_KEYS)，每个进程调用一次"""
+    ## initialize the shared HTTP connection pool
+    http_util.configure(config.get("http_config"))
+    response_cache.configure(config.get("response_cache"))
+
+    ## 长微博、组图与视频链接的补全线程数(workers)与单个任务的超时时间(timeout)
+    from .parser import configure_enrichment, configure_streaming
+
+    configure_enrichment(config.get("enrich_config"))
+    ## feed页与评论页是否边接收边解析(enabled)，以及每次读取的字节数(chunk_size)
+    configure_streaming(config.get("stream_parse"))
+
+    ## 下载线程数(workers)、每个host的并发上限(per_host)与写入块大小(chunk_size)
+    if config.get("pic_download") or config.get("video_download"):
+        from .downloader import configure_download_pool
+
+        configure_download_pool(config.get("download_config"))
+
+
 class Spider:
-    def __init__(self, config: dict) -> None:
-        """Spider类初始化"""
+    def __init__(self, config: dict, configure_globals=True) -> None:
+        """Spider类初始化
+
+        configure_globals为False时不调用configure_process，沿用进程中已有的会话、缓存与线程池
+        """
         self.cookie = config["cookie"]  # user cookie
+        self.name = config.get("name")  # 多账号模式下的账号名，用于区分结果文件
+        self.claims = None  # 多账号模式下由supervisor设置，用于在分片之间去重
         self.filter = config["filter"]  # 取值范围为0、1,程序默认值为0,代表要爬取用户的全部微博,1代表只爬取用户的原创微博
 
         ## get interval between refreshes (in seconds)
         self.refresh_interval = config["refresh_interval"]
+        self.scheduler = AdaptiveScheduler(
+            self.refresh_interval,
+            config.get("min_refresh_interval"),  # 刷新间隔下限，默认等于refresh_interval
+            config.get("max_refresh_interval"),  # 刷新间隔上限，默认等于refresh_interval
+        )
+
+        ## get paging config
+        self.max_page = config.get("max_page", 1)  # 每次刷新最多爬取的首页页数
+        self.page_prefetch = config.get(
+            "page_prefetch", 2
+        )  # 提前并发获取的后续页数，为0时逐页获取
+
+        ## get async engine config
+        self.async_mode = config.get("async_mode", 0)  # 取值范围为0、1,1代表使用异步引擎刷新
+        self.async_concurrency = config.get(
+            "async_concurrency", 8
+        )  # 异步引擎同时进行的阻塞调用(网络请求、写入、下载)上限
 
         ## get DB configs
-        # self.mysql_config = config.get('mysql_config')
-        # self.sqlite_config = config.get('sqlite_config')
-        # self.kafka_config = config.get('kafka_config')
+        self.mysql_config = config.get("mysql_config")
+        self.sqlite_config = config.get("sqlite_config")
+        self.kafka_config = config.get("kafka_config")
         self.mongo_config = config.get("mongo_config")
 
+        ## 进程内共享的会话、缓存与线程池；多账号模式下由worker按全局配置设置一次
+        if configure_globals:
+            configure_process(config)
+
         ## get writer/downloader config
         self.write_mode = config[
             "write_mode"
@@ -54,11 +111,15 @@ class Spider:
             "result_dir_name", 0
         )  # 结果目录名，取值为0或1，决定结果文件存储在用户昵称文件夹里还是用户id文件夹里
 
+        ## csv/json文件的写缓冲、轮转、压缩、fsync策略与索引
+        file_config = config.get("file_config")
         self.writers = []
         if "csv" in self.write_mode:
             from .writer import CsvWriter
 
-            self.writers.append(CsvWriter(self._get_filepath("csv"), self.filter))
+            self.writers.append(
+                CsvWriter(self._get_filepath("csv"), self.filter, file_config)
+            )
         if "txt" in self.write_mode:
             from .writer import TxtWriter
 
@@ -66,24 +127,27 @@ class Spider:
         if "json" in self.write_mode:
             from .writer import JsonWriter
 
-            self.writers.append(JsonWriter(self._get_filepath("json")))
+            self.writers.append(JsonWriter(self._get_filepath("json"), file_config))
         if "mongo" in self.write_mode:
             from .writer import MongoWriter
 
             self.writers.append(MongoWriter(self.mongo_config))
-        # if "mysql" in self.write_mode:
-        #     from .writer import MySqlWriter
+        if "mysql" in self.write_mode:
+            from .writer import MySqlWriter
 
-        #     self.writers.append(MySqlWriter(self.mysql_config))
-        # if "sqlite" in self.write_mode:
-        #     from .writer import SqliteWriter
+            self.writers.append(MySqlWriter(self.mysql_config))
+        if "sqlite" in self.write_mode:
+            from .writer import SqliteWriter
 
-        #     self.writers.append(SqliteWriter(self.sqlite_config))
-        # if "kafka" in self.write_mode:
-        #     from .writer import KafkaWriter
+            self.writers.append(SqliteWriter(self.sqlite_config))
+        if "kafka" in self.write_mode:
+            from .writer import KafkaWriter
 
-        #     self.writers.append(KafkaWriter(self.kafka_config))
+            self.writers.append(
+                KafkaWriter(self.kafka_config, on_batch=self._on_kafka_batch)
+            )
 
+        ## get downloaders
         self.downloaders = []
         if self.pic_download == 1:
             from .downloader import (
@@ -109,64 +173,216 @@ class Spider:
                 VideoDownloader(self._get_filepath("video"), self.file_download_timeout)
             )
 
+        ## initialize the write-behind queue, writing synchronously if not configured
+        self.write_queue = None
+        write_queue_config = config.get("write_queue")
+        if write_queue_config:
+            self.write_queue = WriteBehindQueue(
+                self.write_weibo,
+                self.write_user,
+                write_queue_config.get("batch_size", 20),  # 每批最多写入的微博数
+                write_queue_config.get("max_age", 5),  # 微博在队列中最多等待的秒数
+                write_queue_config.get("max_pending", 200),  # 队列容量，满时爬取等待写入
+            )
+
+        ## initialize the persistent user cache
+        user_cache_config = config.get("user_cache", {})
+        self.user_cache = UserCache(
+            user_cache_config.get("path", "user_cache.db"),
+            user_cache_config.get("ttl", 7 * 24 * 3600),  # 用户信息的有效期(秒)
+            user_cache_config.get("max_size", 10000),  # 最多缓存的用户数
+        )
+        self._user_refresher = ThreadPoolExecutor(max_workers=1)
+        self._refreshing_users = set()
+
+        ## initialize the persistent index of fetched weibo ids
+        seen_index_config = config.get("seen_index", {})
+        self.seen_index = SeenIndex(
+            seen_index_config.get("path", "seen_index.db"),
+            seen_index_config.get("max_age", 3 * 24 * 3600),  # id保留的时间(秒)
+            seen_index_config.get("max_size", 100000),  # 最多保留的id数
+        )
+
         ## initialize starting time
         self.since_time = datetime.now()
 
         ## initialize statistical info
         self.got_num = 0
-        self.weibo_id_list = []
-        self.user_id_set = set()
+        self._refresh_started = time.perf_counter()
+        self.first_page_new = (0, 0)  # 上一次刷新第一页的新微博数与条目数
+        self.kafka_delivery = [0, 0]  # 本次刷新Kafka确认成功与失败的消息数
 
     def write_weibo(self, weibos: list[Weibo]):
         """Write weibos to file and/or database"""
         for writer in self.writers:
-            writer.write_weibo(weibos)
+            with metrics.span("write", writer=type(writer).__name__, kind="weibo"):
+                writer.write_weibo(weibos)
+        # 所有writer都写入成功后才记为已爬取，写入失败的微博下一轮会重新爬取
+        self._mark_written(weibos)
         for downloader in self.downloaders:
             downloader.download_files(weibos)
 
+    def _mark_written(self, weibos: list[Weibo]):
+        """记入seen_index，多账号模式下同时确认对这些微博的认领"""
+        ids = [weibo.id for weibo in weibos]
+        self.seen_index.add(*ids)
+        if self.claims is not None:
+            self.claims.confirm("weibo", ids)
+
     def write_user(self, user: User):
         """Write user info to file and/or database"""
         for writer in self.writers:
-            writer.write_user(user)
+            with metrics.span("write", writer=type(writer).__name__, kind="user"):
+                writer.write_user(user)
 
     def get_user_info(self, user_uri) -> User:
         """获取用户信息"""
+        from .parser import IndexParser
+
         return IndexParser(self.cookie, user_uri).get_user()
 
+    def save_user(self, user: User):
+        """写入用户信息并更新用户缓存"""
+        if user:
+            if self.write_queue:
+                self.write_queue.put_user(user)
+            else:
+                self.write_user(user)
+            self.user_cache.put(user)
+
+    def claim(self, kind, key) -> bool:
+        """多账号模式下认领一条微博或一个用户，已被其他分片认领时返回False"""
+        return self.claims is None or self.claims.claim(kind, key)
+
+    def need_user(self, user_id) -> bool:
+        """用户信息不在缓存中时返回True，需要立即获取；缓存过期时在后台刷新"""
+        user, fresh = self.user_cache.lookup(user_id)
+        if user is None:
+            return self.claim("user", user_id)
+        if not fresh and user_id not in self._refreshing_users:
+            self._refreshing_users.add(user_id)
+            self._user_refresher.submit(self._refresh_user, user_id)
+        return False
+
+    def _refresh_user(self, user_id):
+        """后台刷新过期的用户信息"""
+        try:
+            self.save_user(self.get_user_info(user_id))
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            self._refreshing_users.discard(user_id)
+
     def download_user_avatar(self, user_uri):
         """下载用户头像"""
+        from .downloader import AvatarPictureDownloader
+        from .parser import AlbumParser, PhotoParser
+
         avatar_album_url = PhotoParser(self.cookie, user_uri).extract_avatar_album_url()
         pic_urls = AlbumParser(self.cookie, avatar_album_url).extract_pic_urls()
-        AvatarPictureDownloader(
+        downloader = AvatarPictureDownloader(
             self._get_filepath("img"), self.file_download_timeout
-        ).handle_download(pic_urls)
+        )
+        downloader.handle_download(pic_urls)
+        downloader.wait()
+
+    def _get_filepath(self, type):
+        """获取结果文件路径，图片和视频返回保存目录"""
+        file_dir = os.getcwd() + os.sep + "weibo"
+        if type == "img" or type == "video":
+            file_dir = file_dir + os.sep + type
+        if not os.path.isdir(file_dir):
+            os.makedirs(file_dir)
+        if type == "img" or type == "video":
+            return file_dir
+        if self.name:
+            return file_dir + os.sep + "feed_%s.%s" % (self.name, type)
+        return file_dir + os.sep + "feed." + type
+
+    def _fetch_page(self, page) -> "PageParser":
+        """获取首页第page页"""
+        from .parser import PageParser
+
+        # 有待重试的微博时，内容未变的页面也要解析
+        return PageParser(
+            self.cookie,
+            self.filter,
+            self.since_time,
+            page,
+            skip_unchanged=not self.seen_index.retrying(),
+        )
 
     def get_weibo_info(self) -> Generator[list[Weibo], None, None]:
-        """Parse web request and get weibo info"""
-        ## TODO: add support to parse multiple pages
+        """Parse web request and get weibo info, page by page"""
+        executor = None
+        pending = {}
         try:
-            weibos, self.weibo_id_list, to_continue = PageParser(
-                self.cookie, self.filter, self.since_time
-            ).get_one_page(self.weibo_id_list)
-            if weibos:
-                yield weibos
-            # if not to_continue:
-            #     break
+            if self.max_page > 1 and self.page_prefetch > 0:
+                executor = ThreadPoolExecutor(max_workers=self.page_prefetch)
+            for page in range(1, self.max_page + 1):
+                ## keep up to page_prefetch pages after the current one in flight
+                if executor:
+                    last = min(page + self.page_prefetch, self.max_page)
+                    for p in range(page + 1, last + 1):
+                        if p not in pending:
+                            pending[p] = executor.submit(self._fetch_page, p)
+                if page in pending:
+                    page_parser = pending.pop(page).result()
+                else:
+                    page_parser = self._fetch_page(page)
+
+                result = page_parser.get_one_page(self.seen_index)
+                if result is None:
+                    break
+                weibos, _, to_continue = result
+                if page == 1:
+                    # 内容未变的第一页同样算作没有新微博
+                    page_size = 1 if page_parser.unchanged else page_parser.item_count
+                    self.first_page_new = (len(weibos), page_size)
+                if weibos:
+                    yield weibos
+                if not to_continue:
+                    break
 
         except Exception as e:
             logger.exception(e)
-
-    def sleep(self):
-        """Sleep till next refresh"""
+        finally:
+            if executor:
+                for future in pending.values():
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+    def next_refresh(self) -> float:
+        """根据上一次刷新调整间隔并重置since_time，返回下一次刷新开始的单调时钟时刻"""
+        self.scheduler.observe(*self.first_page_new)
+        self.first_page_new = (0, 0)
         self.since_time = datetime.now()
+        oldest = self.seen_index.oldest_pending()
+        if oldest is not None and oldest < self.since_time:
+            # 上一轮有没能写入的微博，下一轮从其中最早的一条开始重新爬取
+            self.since_time = oldest
         logger.info(f"Reset since_time to {self.since_time}")
-        logger.info(f"Sleeping for {self.refresh_interval} seconds...")
-        for _ in tqdm(range(self.refresh_interval)):
-            time.sleep(1)
+        return self.scheduler.next_deadline()
+
+    def sleep(self):
+        """Sleep till next refresh, as scheduled from the start of the last one"""
+        from tqdm import tqdm
+
+        deadline = self.next_refresh()
+        remaining = deadline - time.monotonic()
+        logger.info(f"Sleeping for {max(remaining, 0):.0f} seconds...")
+        with tqdm(total=max(int(round(remaining)), 0)) as bar:
+            while remaining > 0:
+                time.sleep(min(remaining, 1))
+                bar.update(1)
+                remaining = deadline - time.monotonic()
+        self.scheduler.start()
 
     def get_feed(self):
         """Start fetching weibos posted aft last refresh from my feed"""
         ## Adapted based on combination of Spider.get_one_user() and Spider.start()
+        from tqdm import tqdm
+
         try:
             logger.info(
                 "Start fetching weibos posted after: "
@@ -174,26 +390,101 @@ class Spider:
             )
 
             self.got_num = 0  # reset the number of wbs fetched in this refresh
-            self.weibo_id_list = []  # NOTE: I have no clue what's the purpose of this
+            self._refresh_started = time.perf_counter()
+            self.seen_index.start_refresh()
 
+            new_weibos = []
             for weibos in self.get_weibo_info():
+                # 多账号模式下同一条微博只由最先认领的分片写入
+                claimed = []
+                for wb in weibos:
+                    if self.claim("weibo", wb.id):
+                        claimed.append(wb)
+                    else:
+                        self.seen_index.discard_pending(wb.id)
+                weibos = claimed
                 for wb in tqdm(weibos):
-                    if wb.user_id not in self.user_id_set:
-                        self.write_user(self.get_user_info(wb.user_id))
-                        self.user_id_set.add(wb.user_id)
-                    self.write_weibo([wb])
+                    if self.need_user(wb.user_id):
+                        self.save_user(self.get_user_info(wb.user_id))
+                if self.write_queue:
+                    self.write_queue.put_weibos(weibos)
+                else:
+                    new_weibos.extend(weibos)
                 self.got_num += len(weibos)
+            ## write all weibos of this refresh as one batch
+            if new_weibos:
+                self.write_weibo(new_weibos)
+            elif self.write_queue:
+                # 等队列写完本轮的微博再统计，也保证不与下一轮的写入交错
+                self.write_queue.flush()
 
-            if not self.filter:
-                logger.info("共爬取" + str(self.got_num) + "条微博")
-            else:
-                logger.info("共爬取" + str(self.got_num) + "条原创微博")
-            logger.info("信息抓取完毕")
-            logger.info("*" * 100)
+            self._log_summary()
+
+        except Exception as e:
+            logger.exception(e)
+
+    async def get_feed_async(self):
+        """Same as get_feed, but handles posts concurrently with AsyncEngine"""
+        from .async_engine import AsyncEngine
+
+        try:
+            logger.info(
+                "Start fetching weibos posted after: "
+                + self.since_time.strftime("%Y-%m-%d %H:%M")
+            )
+            self.seen_index.start_refresh()
+            self._refresh_started = time.perf_counter()
+            self.got_num = await AsyncEngine(self, self.async_concurrency).get_feed()
+            self._log_summary()
 
         except Exception as e:
             logger.exception(e)
 
+    def run_async(self):
+        """Run one refresh cycle on the async engine"""
+        import asyncio
+
+        asyncio.run(self.get_feed_async())
+
+    def close(self):
+        """写完队列中剩余的数据并释放资源"""
+        # 后台刷新用户信息的线程可能还会往队列里放数据，需先于队列关闭
+        self._user_refresher.shutdown(wait=True)
+        try:
+            if self.write_queue:
+                self.write_queue.close()
+        finally:
+            for writer in self.writers:
+                writer.close()
+            self.user_cache.close()
+            self.seen_index.close()
+
+    def _on_kafka_batch(self, kind, delivered, failed, seconds):
+        """KafkaWriter每批消息全部确认后的回调，可能在生产者的线程中调用"""
+        self.kafka_delivery[0] += delivered
+        self.kafka_delivery[1] += failed
+        metrics.inc("kafka_messages_total", delivered, kind=kind, result="delivered")
+        metrics.inc("kafka_messages_total", failed, kind=kind, result="failed")
+        metrics.observe("kafka_batch", seconds, kind=kind)
+
+    def _log_summary(self):
+        """输出本次刷新的统计信息"""
+        if not self.filter:
+            logger.info("共爬取" + str(self.got_num) + "条微博")
+        else:
+            logger.info("共爬取" + str(self.got_num) + "条原创微博")
+        logger.info("信息抓取完毕")
+        metrics.inc("weibos_total", self.got_num)
+        metrics.observe("refresh", time.perf_counter() - self._refresh_started)
+        http_util.log_host_stats()
+        if "kafka" in self.write_mode:
+            logger.info(
+                "Kafka确认%d条，失败%d条", self.kafka_delivery[0], self.kafka_delivery[1]
+            )
+            self.kafka_delivery = [0, 0]
+        metrics.log_refresh_summary()
+        logger.info("*" * 100)
+
 
 def _get_config():
     """Get config from config.json"""
@@ -213,18 +504,60 @@ def _get_config():
         sys.exit()
 
 
-def main():
+def _handle_sigterm(signum, frame):
+    sys.exit(0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="定时爬取微博首页的新微博")
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="只刷新一次后退出，供cron等外部调度使用；爬取最长刷新间隔内的微博，已爬取过的由seen_index跳过",
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    wb = None
     try:
         config = _get_config()
         config_util.validate_config(config)
+        if config.get("accounts"):
+            if args.once:
+                logger.warning("多账号模式不支持--once，请去掉accounts或--once后再运行程序")
+                sys.exit()
+            from .supervisor import Supervisor
+
+            Supervisor(config).run()
+            return
         wb = Spider(config)
+        if config.get("metrics_port"):
+            metrics.start_http_server(config["metrics_port"])
+        signal.signal(signal.SIGTERM, _handle_sigterm)  # 退出前写完队列中的数据
+
+        if args.once:
+            wb.since_time = datetime.now() - timedelta(
+                seconds=wb.scheduler.max_interval
+            )
+            wb.scheduler.start()
+            if wb.async_mode:
+                wb.run_async()
+            else:
+                wb.get_feed()
+            return
 
         while True:
             wb.sleep()  # update time_since and sleep for refresh interval
-            wb.get_feed()  # start running
+            if wb.async_mode:
+                wb.run_async()
+            else:
+                wb.get_feed()  # start running
 
     except Exception as e:
         logger.exception(e)
+    finally:
+        if wb:
+            wb.close()
 
 
 if __name__ == "__main__":
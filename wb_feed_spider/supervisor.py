@@ -0,0 +1,291 @@
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+from .config_util import PROCESS_CONFIG_KEYS
+
+logger = logging.getLogger("spider.supervisor")
+
+
+class LeaseStore:
+    """多个进程(或共享同一文件的多台机器)之间共享的租约与认领记录
+
+    lease表记录每个账号由哪个worker负责及租约到期时间，到期未续约的账号可被其他worker接管；
+    claim表记录已被某个worker处理的微博、用户等，用来在分片之间去重。
+    认领在confirm之前只在ttl秒内有效，认领者中途崩溃时其他worker可以重新认领。
+
+    WAL模式依赖共享内存，不能用于网络文件系统，这里使用DELETE日志模式；
+    多台机器共享时，文件所在的文件系统必须支持可靠的文件锁(如启用了锁服务的NFS)。
+    """
+
+    def __init__(self, path="lease.db", claim_max_age=3 * 24 * 3600):
+        self.claim_max_age = claim_max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lease ("
+            "account TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS claim ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, owner TEXT NOT NULL, "
+            "claimed_at REAL NOT NULL, done INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (kind, key))"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(claim)")]
+        if "done" not in columns:
+            # 旧版本建立的claim表
+            try:
+                self._conn.execute(
+                    "ALTER TABLE claim ADD COLUMN done INTEGER NOT NULL DEFAULT 0"
+                )
+            except sqlite3.OperationalError:
+                pass  # 其他进程已经加上
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS claim_claimed_at ON claim (claimed_at)"
+        )
+
+    def acquire(self, account, owner, ttl):
+        """获取或续约account的租约，成功时返回True"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO lease (account, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(account) DO UPDATE SET "
+                "owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE lease.owner = excluded.owner OR lease.expires_at < ?",
+                (account, owner, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, account, owner):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM lease WHERE account = ? AND owner = ?", (account, owner)
+            )
+
+    def claim(self, kind, key, owner, ttl=None):
+        """认领一条记录，之前没有被认领(或未确认的认领属于自己、已超过ttl秒)时返回True"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO claim (kind, key, owner, claimed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(kind, key) DO UPDATE SET "
+                "owner = excluded.owner, claimed_at = excluded.claimed_at "
+                "WHERE claim.done = 0 "
+                "AND (claim.owner = excluded.owner OR claim.claimed_at < ?)",
+                (kind, key, owner, now, now - ttl if ttl else -1),
+            )
+            return cursor.rowcount == 1
+
+    def confirm(self, kind, keys, owner):
+        """处理完成后确认owner的认领，确认后不再过期(直到被expire清除)"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE claim SET done = 1 WHERE kind = ? AND key = ? AND owner = ?",
+                [(kind, key, owner) for key in keys],
+            )
+
+    def expire(self):
+        """清除超过claim_max_age的认领记录"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM claim WHERE claimed_at < ?",
+                (time.time() - self.claim_max_age,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Claims:
+    """绑定了owner的LeaseStore，供Spider判断微博、用户是否已由其他分片处理"""
+
+    def __init__(self, store, owner, user_ttl=600, weibo_ttl=600):
+        self.store = store
+        self.owner = owner
+        self.user_ttl = user_ttl  # 用户的认领在该秒数后失效，之后缓存仍未命中时可重新抓取
+        self.weibo_ttl = weibo_ttl  # 微博写入前崩溃时，认领在该秒数后失效，可由其他分片重新认领
+
+    def claim(self, kind, key):
+        return self.store.claim(
+            kind, key, self.owner, self.user_ttl if kind == "user" else self.weibo_ttl
+        )
+
+    def confirm(self, kind, keys):
+        self.store.confirm(kind, keys, self.owner)
+
+
+def account_config(config, account):
+    """合并出单个账号的配置：账号中的键覆盖全局配置，seen_index默认按账号分开保存
+
+    PROCESS_CONFIG_KEYS由worker按全局配置设置，账号中的这些键被忽略
+    """
+    merged = {k: v for k, v in config.items() if k != "accounts"}
+    merged.update(
+        (k, v) for k, v in account.items() if k not in PROCESS_CONFIG_KEYS
+    )
+    if "seen_index" not in account:
+        seen_index = dict(config.get("seen_index", {}))
+        seen_index["path"] = "seen_index.%s.db" % account["name"]
+        merged["seen_index"] = seen_index
+    return merged
+
+
+class Worker:
+    """一个worker进程：按租约认领最多quota个账号，每个账号一个Spider，按各自的刷新时刻轮流刷新"""
+
+    def __init__(self, config, index, quota):
+        supervisor_config = config.get("supervisor", {})
+        self.config = config
+        self.accounts = config["accounts"]
+        self.index = index
+        self.quota = quota
+        # 租约有效期，默认为最长刷新间隔的3倍，每隔1/3有效期续约一次
+        self.lease_ttl = supervisor_config.get(
+            "lease_ttl",
+            3 * config.get("max_refresh_interval", config["refresh_interval"]),
+        )
+        self.owner = "%s:%d:%d" % (socket.gethostname(), os.getpid(), index)
+        self.store = LeaseStore(
+            supervisor_config.get("lease_path", "lease.db"),
+            supervisor_config.get("claim_max_age", 3 * 24 * 3600),
+        )
+        self.claims = Claims(
+            self.store,
+            self.owner,
+            supervisor_config.get("user_claim_ttl", 600),
+            supervisor_config.get("weibo_claim_ttl", 600),
+        )
+        self.spiders = {}  # 账号名 -> [Spider, 下一次刷新的单调时钟时刻]
+
+        from .spider import configure_process
+
+        configure_process(config)
+
+    def _start_spider(self, account):
+        from .spider import Spider
+
+        # 进程内共享的会话、缓存等已在__init__中配置，接管账号时不能重建
+        spider = Spider(account_config(self.config, account), configure_globals=False)
+        spider.claims = self.claims
+        logger.info("%s开始负责账号%s", self.owner, account["name"])
+        return [spider, spider.next_refresh()]
+
+    def _stop_spider(self, name):
+        spider, _ = self.spiders.pop(name)
+        try:
+            spider.close()
+        finally:
+            self.store.release(name, self.owner)
+
+    def _renew_leases(self):
+        """续约已持有的账号，并在未达到quota时认领空闲的账号"""
+        n = len(self.accounts)
+        for i in range(n):
+            account = self.accounts[(self.index + i) % n]
+            name = account["name"]
+            if name in self.spiders:
+                if not self.store.acquire(name, self.owner, self.lease_ttl):
+                    logger.warning("%s的租约已被其他worker接管", name)
+                    self._stop_spider(name)
+            elif len(self.spiders) < self.quota:
+                if self.store.acquire(name, self.owner, self.lease_ttl):
+                    self.spiders[name] = self._start_spider(account)
+
+    def run(self):
+        renew_interval = self.lease_ttl / 3
+        try:
+            while True:
+                self._renew_leases()
+                if not self.spiders:
+                    time.sleep(renew_interval)
+                    continue
+                name = min(self.spiders, key=lambda k: self.spiders[k][1])
+                spider, deadline = self.spiders[name]
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    time.sleep(min(wait, renew_interval))
+                    continue
+                spider.scheduler.start()
+                if spider.async_mode:
+                    spider.run_async()
+                else:
+                    spider.get_feed()
+                self.spiders[name][1] = spider.next_refresh()
+                self.store.expire()
+        finally:
+            for name in list(self.spiders):
+                self._stop_spider(name)
+            self.store.close()
+
+
+def _handle_sigterm(signum, frame):
+    sys.exit(0)
+
+
+def _run_worker(config, index, quota):
+    if not logging.getLogger().handlers:
+        # 以spawn方式启动的子进程不继承主进程的日志配置
+        from .spider import setup_logging
+
+        setup_logging()
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    try:
+        Worker(config, index, quota).run()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    except Exception as e:
+        logger.exception(e)
+
+
+class Supervisor:
+    """多账号模式：启动processes个worker进程，账号通过LeaseStore中的租约分配到各worker
+
+    多台机器共享同一个lease_path时，也按租约分摊账号，此时应把accounts_per_worker设小，
+    以免第一台启动的机器认领全部账号；lease_path所在的文件系统须支持可靠的文件锁。
+    """
+
+    def __init__(self, config):
+        supervisor_config = config.get("supervisor", {})
+        self.config = config
+        accounts = config["accounts"]
+        self.processes = min(
+            supervisor_config.get("processes", os.cpu_count() or 1), len(accounts)
+        )
+        self.quota = supervisor_config.get(
+            "accounts_per_worker", math.ceil(len(accounts) / self.processes)
+        )
+
+    def run(self):
+        workers = [
+            multiprocessing.Process(
+                target=_run_worker,
+                args=(self.config, i, self.quota),
+                name="worker-%d" % i,
+            )
+            for i in range(self.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        logger.info("启动了%d个worker进程，每个最多负责%d个账号", len(workers), self.quota)
+        try:
+            for worker in workers:
+                worker.join()
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in workers:
+                worker.join()
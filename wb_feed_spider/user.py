@@ -1,4 +1,25 @@
+from operator import attrgetter
+
+
 class User:
+    # 字段顺序即to_tuple()的顺序
+    FIELDS = (
+        "id",
+        "nickname",
+        "gender",
+        "location",
+        "birthday",
+        "description",
+        "verified_reason",
+        "talent",
+        "education",
+        "work",
+        "weibo_num",
+        "following",
+        "followers",
+    )
+    __slots__ = FIELDS
+
     def __init__(self):
         self.id = ""
 
@@ -18,6 +39,22 @@ class User:
         self.following = 0
         self.followers = 0
 
+    def to_tuple(self):
+        """按FIELDS顺序返回各字段的值"""
+        return _get_fields(self)
+
+    def to_dict(self):
+        """返回 {字段名: 值}，值本身不做复制"""
+        return dict(zip(self.FIELDS, _get_fields(self)))
+
+    @classmethod
+    def from_dict(cls, data):
+        user = cls()
+        for key in cls.FIELDS:
+            if key in data:
+                setattr(user, key, data[key])
+        return user
+
     def __str__(self):
         """打印微博用户信息"""
         result = ""
@@ -27,3 +64,6 @@ class User:
         result += "关注数: %d\n" % self.following
         result += "粉丝数: %d\n" % self.followers
         return result
+
+
+_get_fields = attrgetter(*User.FIELDS)
@@ -0,0 +1,67 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from .user import User
+
+logger = logging.getLogger("spider.user_cache")
+
+
+class UserCache:
+    """持久化的用户信息缓存
+
+    以user_id为键存放在sqlite文件中，重启后仍然有效。超过ttl秒的记录视为过期，
+    记录数超过max_size时按最近访问时间淘汰最旧的记录。
+    """
+
+    def __init__(self, path="user_cache.db", ttl=7 * 24 * 3600, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user ("
+                "id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS user_accessed_at ON user (accessed_at)"
+            )
+
+    def lookup(self, user_id):
+        """返回 (user, 是否未过期)，不存在时返回 (None, False)"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT data, fetched_at FROM user WHERE id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return None, False
+            self._conn.execute(
+                "UPDATE user SET accessed_at = ? WHERE id = ?", (now, user_id)
+            )
+        return User.from_dict(json.loads(row[0])), now - row[1] < self.ttl
+
+    def put(self, user: User):
+        """写入或更新一条用户信息，并按LRU淘汰超出容量的记录"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO user (id, data, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (user.id, json.dumps(user.to_dict(), ensure_ascii=False), now, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM user").fetchone()
+            if count > self.max_size:
+                self._conn.execute(
+                    "DELETE FROM user WHERE id IN "
+                    "(SELECT id FROM user ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_size,),
+                )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,4 +1,26 @@
+from operator import attrgetter
+
+
 class Weibo:
+    # 字段顺序即to_tuple()的顺序；图片url以tuple保存，没有图片时为空tuple
+    FIELDS = (
+        "id",
+        "user_id",
+        "content",
+        "article_url",
+        "original_pictures",
+        "retweet_pictures",
+        "original",
+        "video_url",
+        "publish_place",
+        "publish_time",
+        "publish_tool",
+        "up_num",
+        "retweet_num",
+        "comment_num",
+    )
+    __slots__ = FIELDS
+
     def __init__(self):
         self.id = ""
         self.user_id = ""
@@ -6,7 +28,7 @@ class Weibo:
         self.content = ""
         self.article_url = ""
 
-        self.original_pictures = []
+        self.original_pictures = ()
         self.retweet_pictures = None
         self.original = None
         self.video_url = ""
@@ -19,6 +41,22 @@ class Weibo:
         self.retweet_num = 0
         self.comment_num = 0
 
+    def to_tuple(self):
+        """按FIELDS顺序返回各字段的值"""
+        return _get_fields(self)
+
+    def to_dict(self):
+        """返回 {字段名: 值}，值本身不做复制"""
+        return dict(zip(self.FIELDS, _get_fields(self)))
+
+    @classmethod
+    def from_dict(cls, data):
+        weibo = cls()
+        for key in cls.FIELDS:
+            if key in data:
+                setattr(weibo, key, data[key])
+        return weibo
+
     def __str__(self):
         """打印一条微博"""
         result = self.content + "\n"
@@ -30,3 +68,6 @@ class Weibo:
         result += "评论数：%d\n" % self.comment_num
         result += "url：https://weibo.cn/comment/%s\n" % self.id
         return result
+
+
+_get_fields = attrgetter(*Weibo.FIELDS)
@@ -0,0 +1,120 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger("spider.write_queue")
+
+_STOP = "stop"
+_FLUSH = "flush"
+_POLL_INTERVAL = 1  # 等待队列时检查后台线程是否异常退出的间隔(秒)
+
+
+class WriteBehindQueue:
+    """Spider与writer/downloader之间的有界写入队列
+
+    后台线程把微博攒成批次，数量达到batch_size或最早一条已等待max_age秒时交给write_weibo；
+    用户信息随到随写，保证先于其微博写入。队列中超过max_pending条时put会阻塞，形成背压。
+    writer抛出的Exception只记录日志；SystemExit等使后台线程退出的异常会在之后的put/flush/close中抛出。
+    """
+
+    def __init__(
+        self, write_weibo, write_user, batch_size=20, max_age=5, max_pending=200
+    ):
+        self.write_weibo = write_weibo
+        self.write_user = write_user
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def put_weibos(self, weibos):
+        for weibo in weibos:
+            self._put(("weibo", weibo))
+
+    def put_user(self, user):
+        self._put(("user", user))
+
+    def flush(self):
+        """阻塞直到此前放入的所有数据都已写入"""
+        done = threading.Event()
+        self._put((_FLUSH, done))
+        while not done.wait(_POLL_INTERVAL):
+            self._check()
+
+    def close(self):
+        """写入剩余数据并停止后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            self._put((_STOP, None))
+            self._thread.join()
+        self._check()
+
+    def _check(self):
+        """后台线程因异常退出时，在调用者的线程中重新抛出该异常"""
+        if self._error is not None:
+            raise self._error
+
+    def _put(self, item):
+        # 后台线程已退出时队列不会再被取空，不能无限期阻塞
+        while True:
+            self._check()
+            try:
+                self._queue.put(item, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def _write_batch(self, batch):
+        try:
+            self.write_weibo(batch)
+        except Exception as e:
+            logger.exception(e)
+
+    def _run(self):
+        try:
+            self._loop()
+        except BaseException as e:
+            # 如writer中的sys.exit()，记录下来由put/flush/close抛出
+            logger.exception("写入线程异常退出")
+            self._error = e
+
+    def _loop(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = max(deadline - time.monotonic(), 0) if batch else None
+            try:
+                kind, item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write_batch(batch)
+                batch = []
+                continue
+
+            if kind == "weibo":
+                if not batch:
+                    deadline = time.monotonic() + self.max_age
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            elif kind == "user":
+                try:
+                    self.write_user(item)
+                except Exception as e:
+                    logger.exception(e)
+                continue
+
+            if batch:
+                self._write_batch(batch)
+                batch = []
+            if kind == _FLUSH:
+                item.set()
+            elif kind == _STOP:
+                break
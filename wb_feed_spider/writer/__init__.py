@@ -1,18 +1,18 @@
-# from .csv_writer import CsvWriter
-# from .json_writer import JsonWriter
+from .csv_writer import CsvWriter
+from .json_writer import JsonWriter
+from .kafka_writer import KafkaWriter
 from .mongo_writer import MongoWriter
+from .mysql_writer import MySqlWriter
+from .sqlite_writer import SqliteWriter
 
-# from .mysql_writer import MySqlWriter
 # from .txt_writer import TxtWriter
-# from .sqlite_writer import SqliteWriter
-# from .kafka_writer import KafkaWriter
 
 __all__ = [
-    # CsvWriter,
+    CsvWriter,
     # TxtWriter,
-    # JsonWriter,
+    JsonWriter,
     MongoWriter,
-    # MySqlWriter,
-    # SqliteWriter,
-    # KafkaWriter,
+    MySqlWriter,
+    SqliteWriter,
+    KafkaWriter,
 ]
@@ -0,0 +1,55 @@
+import csv
+import io
+import logging
+import os
+
+from .rotating_file import RotatingFile
+from .writer import Writer
+from ..weibo import Weibo
+from ..user import User
+
+logger = logging.getLogger("spider.csv_writer")
+
+
+def _to_csv_line(row) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(
+        ",".join(v) if isinstance(v, tuple) else ("" if v is None else v) for v in row
+    )
+    return buf.getvalue().encode("utf-8")
+
+
+class CsvWriter(Writer):
+    """追加写入csv文件，每个轮转出的新文件都以表头开始
+
+    filter为1(只爬原创微博)时不写retweet_pictures列
+    """
+
+    def __init__(self, file_path, filter, file_config=None):
+        prefix = os.path.splitext(file_path)[0]
+        self.weibo_fields = [
+            f for f in Weibo.FIELDS if not (filter and f == "retweet_pictures")
+        ]
+        self.weibo_file = RotatingFile(
+            prefix, ".csv", file_config, _to_csv_line(self.weibo_fields)
+        )
+        self.user_file = RotatingFile(
+            prefix + "_user", ".csv", file_config, _to_csv_line(User.FIELDS)
+        )
+
+    def write_weibo(self, weibos: list[Weibo]):
+        """将爬取的微博信息追加写入csv文件"""
+        self.weibo_file.append(
+            (w.id, _to_csv_line(getattr(w, f) for f in self.weibo_fields))
+            for w in weibos
+        )
+        logger.info("%d条微博写入csv文件完毕，保存路径: %s", len(weibos), self.weibo_file.path)
+
+    def write_user(self, user: User):
+        """将爬取的用户信息追加写入csv文件"""
+        self.user_file.append([(user.id, _to_csv_line(user.to_tuple()))])
+        logger.info("%s信息写入csv文件完毕", user.nickname)
+
+    def close(self):
+        self.weibo_file.close()
+        self.user_file.close()
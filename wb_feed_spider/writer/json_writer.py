@@ -0,0 +1,41 @@
+import json
+import logging
+import os
+
+from .rotating_file import RotatingFile
+from .writer import Writer
+from ..weibo import Weibo
+from ..user import User
+
+logger = logging.getLogger("spider.json_writer")
+
+
+class JsonWriter(Writer):
+    """以NDJSON(每行一个json对象)格式追加写入微博与用户信息
+
+    微博写入 <file_path去掉扩展名>.<时间>.ndjson，用户写入 <...>_user.<时间>.ndjson，
+    轮转、压缩、fsync与索引见file_config与RotatingFile
+    """
+
+    def __init__(self, file_path, file_config=None):
+        prefix = os.path.splitext(file_path)[0]
+        self.weibo_file = RotatingFile(prefix, ".ndjson", file_config)
+        self.user_file = RotatingFile(prefix + "_user", ".ndjson", file_config)
+
+    @staticmethod
+    def _to_line(info: dict) -> bytes:
+        return (json.dumps(info, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def write_weibo(self, weibos: list[Weibo]):
+        """将爬取的微博信息追加写入json文件"""
+        self.weibo_file.append((w.id, self._to_line(w.to_dict())) for w in weibos)
+        logger.info("%d条微博写入json文件完毕，保存路径: %s", len(weibos), self.weibo_file.path)
+
+    def write_user(self, user: User):
+        """将爬取的用户信息追加写入json文件"""
+        self.user_file.append([(user.id, self._to_line(user.to_dict()))])
+        logger.info("%s信息写入json文件完毕", user.nickname)
+
+    def close(self):
+        self.weibo_file.close()
+        self.user_file.close()
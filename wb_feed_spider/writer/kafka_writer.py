@@ -0,0 +1,150 @@
+import json
+import logging
+import sys
+import threading
+import time
+
+from .writer import Writer
+from ..weibo import Weibo
+from ..user import User
+
+logger = logging.getLogger("spider.kafka_writer")
+
+# 传给KafkaProducer的默认参数，可在kafka_config中覆盖
+DEFAULT_PRODUCER_CONFIG = {
+    "linger_ms": 50,  # 等待凑批的最长时间
+    "batch_size": 64 * 1024,  # 每个分区一批的最大字节数
+    "compression_type": "gzip",
+    "acks": 1,
+}
+
+
+class _Batch:
+    """一次write_weibo/write_user发送的一批消息，全部确认后汇总一次"""
+
+    __slots__ = ("kind", "pending", "delivered", "failed", "started")
+
+    def __init__(self, kind, count):
+        self.kind = kind
+        self.pending = count
+        self.delivered = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+
+class KafkaWriter(Writer):
+    """把微博和用户信息以json发送到Kafka
+
+    以user_id为key，同一用户的微博进入同一分区，保持顺序。在途(已发送未确认)的消息数不超过
+    max_in_flight，超过时write_weibo阻塞等待确认。每批消息全部确认后更新stats并调用on_batch。
+    producer可以注入任何与kafka-python的KafkaProducer接口一致的对象，
+    bootstrap-server为"memory://"时使用进程内的MemoryProducer(见memory_producer.py)。
+    """
+
+    def __init__(self, kafka_config, producer=None, on_batch=None):
+        self.weibo_topics = kafka_config.get("weibo_topics", [])
+        self.user_topics = kafka_config.get("user_topics", [])
+        self.on_batch = on_batch  # on_batch(kind, delivered, failed, seconds)
+        self._in_flight = threading.BoundedSemaphore(
+            kafka_config.get("max_in_flight", 1000)
+        )
+        self._lock = threading.Lock()
+        self.stats = {
+            "sent": 0,
+            "delivered": 0,
+            "failed": 0,
+            "batches": 0,
+            "batch_seconds": 0.0,
+        }
+        self.producer = producer or self._create_producer(kafka_config)
+
+    @staticmethod
+    def _create_producer(kafka_config):
+        servers = kafka_config.get("bootstrap-server", "127.0.0.1:9092")
+        if servers == "memory://":
+            from .memory_producer import MemoryProducer
+
+            return MemoryProducer()
+        try:
+            from kafka import KafkaProducer
+        except ImportError:
+            logger.warning("系统中可能没有安装kafka-python库，请先运行 pip install kafka-python ，再运行程序")
+            sys.exit()
+        producer_config = dict(DEFAULT_PRODUCER_CONFIG)
+        producer_config.update(kafka_config.get("producer_config", {}))
+        return KafkaProducer(bootstrap_servers=servers, **producer_config)
+
+    def _on_success(self, batch, _metadata):
+        self._in_flight.release()
+        self._done(batch, True)
+
+    def _on_error(self, batch, exc):
+        self._in_flight.release()
+        logger.warning("消息发送失败: %s", exc)
+        self._done(batch, False)
+
+    def _done(self, batch, ok):
+        with self._lock:
+            if ok:
+                batch.delivered += 1
+                self.stats["delivered"] += 1
+            else:
+                batch.failed += 1
+                self.stats["failed"] += 1
+            batch.pending -= 1
+            if batch.pending:
+                return
+            seconds = time.monotonic() - batch.started
+            self.stats["batches"] += 1
+            self.stats["batch_seconds"] += seconds
+        logger.debug(
+            "%s批次确认完毕: 成功%d条 失败%d条 用时%.3f秒",
+            batch.kind,
+            batch.delivered,
+            batch.failed,
+            seconds,
+        )
+        if self.on_batch:
+            self.on_batch(batch.kind, batch.delivered, batch.failed, seconds)
+
+    def _send(self, kind, topics, messages):
+        """messages为 (key, dict) 的列表，发送到topics中的每个topic"""
+        batch = _Batch(kind, len(topics) * len(messages))
+        if not batch.pending:
+            return
+        for topic in topics:
+            for key, info in messages:
+                value = json.dumps(info, ensure_ascii=False).encode("utf-8")
+                self._in_flight.acquire()
+                try:
+                    future = self.producer.send(
+                        topic, key=key.encode("utf-8"), value=value
+                    )
+                except Exception as e:
+                    self._on_error(batch, e)
+                    continue
+                with self._lock:
+                    self.stats["sent"] += 1
+                future.add_callback(self._on_success, batch)
+                future.add_errback(self._on_error, batch)
+
+    def write_weibo(self, weibos: list[Weibo]):
+        """将爬取的微博信息发送到Kafka"""
+        self._send("weibo", self.weibo_topics, [(w.user_id, w.to_dict()) for w in weibos])
+        logger.info("%d条微博已发送到Kafka", len(weibos))
+
+    def write_user(self, user: User):
+        """将爬取的用户信息发送到Kafka"""
+        self._send("user", self.user_topics, [(user.id, user.to_dict())])
+        logger.info("%s信息已发送到Kafka", user.nickname)
+
+    def close(self):
+        """等待在途消息全部确认后关闭生产者"""
+        self.producer.flush()
+        self.producer.close()
+        logger.info(
+            "Kafka共发送%d条，确认%d条，失败%d条",
+            self.stats["sent"],
+            self.stats["delivered"],
+            self.stats["failed"],
+        )
@@ -0,0 +1,45 @@
+import threading
+
+
+class _Future:
+    """MemoryProducer.send的返回值，接口与kafka-python的FutureRecordMetadata一致"""
+
+    def __init__(self, result=None, exception=None):
+        self.result = result
+        self.exception = exception
+
+    def add_callback(self, fn, *args):
+        if self.exception is None:
+            fn(*args, self.result)
+        return self
+
+    def add_errback(self, fn, *args):
+        if self.exception is not None:
+            fn(*args, self.exception)
+        return self
+
+
+class MemoryProducer:
+    """进程内的生产者替身，消息保存在messages[topic]中并立即确认，用于离线调试
+
+    发往fail_topics中各topic的消息不保存，立即以失败回调，用来模拟投递失败。
+    """
+
+    def __init__(self, fail_topics=()):
+        self.messages = {}
+        self.fail_topics = set(fail_topics)
+        self._lock = threading.Lock()
+
+    def send(self, topic, key=None, value=None):
+        if topic in self.fail_topics:
+            return _Future(exception=RuntimeError("%s投递失败" % topic))
+        with self._lock:
+            partition = self.messages.setdefault(topic, [])
+            partition.append((key, value))
+            return _Future((topic, len(partition) - 1))
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
@@ -1,6 +1,6 @@
-import copy
 import logging
 import sys
+import threading
 
 from .writer import Writer
 from ..weibo import Weibo
@@ -11,50 +11,76 @@ logger = logging.getLogger("spider.mongo_writer")
 
 class MongoWriter(Writer):
     def __init__(self, mongo_config: dict):
+        try:
+            import pymongo
+        except ImportError:
+            logger.warning("系统中可能没有安装pymongo库，请先运行 pip install pymongo ，再运行程序")
+            sys.exit()
+        self._pymongo = pymongo
         self.mongo_config = mongo_config
         self.connection_string = mongo_config["connection_string"]
         self.dba_name = mongo_config.get("dba_name", None)
         self.dba_password = mongo_config.get("dba_password", None)
+        self._client = None
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _get_collection(self, name: str):
+        """获取集合，首次使用时建立长连接并在id上创建唯一索引"""
+        with self._lock:
+            if name in self._collections:
+                return self._collections[name]
+            pymongo = self._pymongo
+            if self._client is None:
+                kwargs = {}
+                if self.dba_name or self.dba_password:
+                    kwargs = {
+                        "username": self.dba_name,
+                        "password": self.dba_password,
+                        "authMechanism": "SCRAM-SHA-1",
+                    }
+                self._client = pymongo.MongoClient(self.connection_string, **kwargs)
+
+            collection = self._client["weibo"][name]
+            try:
+                collection.create_index("id", unique=True)
+            except pymongo.errors.OperationFailure as e:
+                # 旧数据中存在重复id时无法建立唯一索引，不影响写入
+                logger.warning("%s集合创建id唯一索引失败: %s", name, e)
+            self._collections[name] = collection
+            return collection
 
     def _info_to_mongodb(self, collection: str, info_list: list[dict]):
-        """将爬取的信息写入MongoDB数据库"""
+        """将爬取的信息批量upsert到MongoDB数据库"""
+        if not info_list:
+            return
+        pymongo = self._pymongo
         try:
-            import pymongo
-        except ImportError:
-            logger.warning("系统中可能没有安装pymongo库，请先运行 pip install pymongo ，再运行程序")
-            sys.exit()
-        try:
-            from pymongo import MongoClient
-
-            client = MongoClient(self.connection_string)
-            if self.dba_name or self.dba_password:
-                # authenticate() 在PyMongo3.6版本就已弃用，这一段可能需要后续跟进
-                client.admin.authenticate(
-                    self.dba_name, self.dba_password, mechanism="SCRAM-SHA-1"
-                )
-
-            db = client["weibo"]
-            collection = db[collection]
-            new_info_list = copy.deepcopy(info_list)
-            for info in new_info_list:
-                if not collection.find_one({"id": info["id"]}):
-                    collection.insert_one(info)
-                else:
-                    collection.update_one({"id": info["id"]}, {"$set": info})
+            ops = [
+                pymongo.UpdateOne({"id": info["id"]}, {"$set": info}, upsert=True)
+                for info in info_list
+            ]
+            self._get_collection(collection).bulk_write(ops, ordered=False)
         except pymongo.errors.ServerSelectionTimeoutError:
+            # 可能在写入队列的后台线程中，抛出异常由调用者处理，不在这里退出
             logger.warning("系统中可能没有安装或启动MongoDB数据库，请先根据系统环境安装或启动MongoDB，再运行程序")
-            sys.exit()
+            raise
 
     def write_weibo(self, weibos: list[Weibo]):
         """将爬取的微博信息写入MongoDB数据库"""
-        weibo_list = []
-        for w in weibos:
-            weibo_list.append(w.__dict__)
+        weibo_list = [w.to_dict() for w in weibos]
         self._info_to_mongodb("weibo", weibo_list)
         logger.info("%d条微博写入MongoDB数据库完毕", len(weibos))
 
     def write_user(self, user: User):
         """将爬取的用户信息写入MongoDB数据库"""
-        user_list = [user.__dict__]
+        user_list = [user.to_dict()]
         self._info_to_mongodb("user", user_list)
         logger.info("%s信息写入MongoDB数据库完毕", user.nickname)
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+                self._collections = {}
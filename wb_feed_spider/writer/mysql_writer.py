@@ -0,0 +1,210 @@
+import logging
+import sys
+import threading
+from contextlib import contextmanager
+
+from .writer import Writer
+from ..weibo import Weibo
+from ..user import User
+
+logger = logging.getLogger("spider.mysql_writer")
+
+DATABASE = "weibo"
+CREATE_TABLES = (
+    """CREATE TABLE IF NOT EXISTS weibo (
+    id varchar(20) NOT NULL,
+    user_id varchar(20),
+    content text,
+    article_url varchar(200),
+    original_pictures text,
+    retweet_pictures text,
+    original BOOLEAN NOT NULL DEFAULT 1,
+    video_url text,
+    publish_place varchar(100),
+    publish_time DATETIME NOT NULL,
+    publish_tool varchar(30),
+    up_num INT NOT NULL,
+    retweet_num INT NOT NULL,
+    comment_num INT NOT NULL,
+    PRIMARY KEY (id),
+    KEY user_id (user_id),
+    KEY publish_time (publish_time)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    """CREATE TABLE IF NOT EXISTS user (
+    id varchar(20) NOT NULL,
+    nickname varchar(30),
+    gender varchar(10),
+    location varchar(200),
+    birthday varchar(40),
+    description varchar(400),
+    verified_reason varchar(140),
+    talent varchar(200),
+    education varchar(200),
+    work varchar(200),
+    weibo_num INT,
+    following INT,
+    followers INT,
+    PRIMARY KEY (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+)
+# 每条语句长度相对max_allowed_packet留出的余量
+PACKET_MARGIN = 64 * 1024
+
+
+def _upsert_sql(table, fields):
+    """pymysql会把 INSERT ... VALUES (...) 形式的executemany改写为多行INSERT"""
+    return "INSERT INTO %s (%s) VALUES (%s) ON DUPLICATE KEY UPDATE %s" % (
+        table,
+        ", ".join("`%s`" % f for f in fields),
+        ", ".join(["%s"] * len(fields)),
+        ", ".join("`%s` = VALUES(`%s`)" % (f, f) for f in fields if f != "id"),
+    )
+
+
+class MySqlWriter(Writer):
+    """把微博和用户信息写入MySQL
+
+    启动时创建数据库与表，之后从最多pool_size个长连接组成的连接池中取连接。
+    每批记录用一次executemany的 INSERT ... ON DUPLICATE KEY UPDATE 写入，
+    由pymysql拼成多行INSERT，并按服务器的max_allowed_packet切分为多条语句。
+    """
+
+    def __init__(self, mysql_config: dict):
+        try:
+            import pymysql
+        except ImportError:
+            logger.warning("系统中可能没有安装pymysql库，请先运行 pip install pymysql ，再运行程序")
+            sys.exit()
+        self._pymysql = pymysql
+        self.connect_config = {
+            k: v for k, v in mysql_config.items() if k not in ("pool_size", "database")
+        }
+        self.connect_config.setdefault("charset", "utf8mb4")
+        self.database = mysql_config.get("database", DATABASE)
+        self.pool_size = mysql_config.get("pool_size", 2)
+        self._idle = []  # 空闲连接，后放回的先取出
+        self._created = 0  # 已建立(含正在建立)的连接数
+        self._pool_changed = threading.Condition()
+        self._weibo_sql = _upsert_sql("weibo", Weibo.FIELDS)
+        self._user_sql = _upsert_sql("user", User.FIELDS)
+        try:
+            self._create_tables()
+        except self._pymysql.OperationalError:
+            logger.warning("系统中可能没有安装或正确配置MySQL数据库，请先根据系统环境安装或配置MySQL，再运行程序")
+            sys.exit()
+
+    def _open(self, **kwargs):
+        # 运行中连接失败(如MySQL重启)时抛出MySQLError，由write_weibo/write_user的调用者处理
+        return self._pymysql.connect(**self.connect_config, **kwargs)
+
+    def _create_tables(self):
+        """用一个临时连接创建数据库与表"""
+        connection = self._open()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE DATABASE IF NOT EXISTS %s DEFAULT CHARACTER SET utf8mb4"
+                    % self.database
+                )
+                connection.select_db(self.database)
+                for sql in CREATE_TABLES:
+                    cursor.execute(sql)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _connect(self):
+        """新建一个连接池中的连接，连接参数中带上数据库，断线后新建的连接同样可用"""
+        connection = self._open(database=self.database)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT @@max_allowed_packet")
+            (connection.max_allowed_packet,) = cursor.fetchone()
+        return connection
+
+    def _alive(self, connection):
+        try:
+            connection.ping()
+            return True
+        except self._pymysql.MySQLError:
+            connection.close()
+            return False
+
+    @contextmanager
+    def _connection(self):
+        """从连接池取一个连接，池中没有且未达到pool_size时新建，否则等待
+
+        取出的连接已断开时换成新建的连接
+        """
+        with self._pool_changed:
+            while not self._idle and self._created >= self.pool_size:
+                self._pool_changed.wait()
+            if self._idle:
+                connection = self._idle.pop()
+            else:
+                connection = None
+                self._created += 1
+        if connection is None or not self._alive(connection):
+            try:
+                connection = self._connect()
+            except BaseException:
+                self._drop()
+                raise
+        try:
+            yield connection
+        except BaseException:
+            connection.close()
+            self._drop()
+            raise
+        with self._pool_changed:
+            self._idle.append(connection)
+            self._pool_changed.notify()
+
+    def _drop(self):
+        """连接失效后减少计数，唤醒一个等待者去新建连接"""
+        with self._pool_changed:
+            self._created -= 1
+            self._pool_changed.notify()
+
+    def _upsert(self, sql, rows):
+        """在一个事务中executemany写入rows"""
+        with self._connection() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.max_stmt_length = max(
+                        connection.max_allowed_packet - PACKET_MARGIN, 64 * 1024
+                    )
+                    cursor.executemany(sql, rows)
+                connection.commit()
+            except self._pymysql.MySQLError:
+                connection.rollback()
+                raise
+
+    @staticmethod
+    def _to_row(values):
+        # 图片url的tuple以逗号连接保存
+        return tuple(",".join(v) if isinstance(v, tuple) else v for v in values)
+
+    def write_weibo(self, weibos: list[Weibo]):
+        """将爬取的微博信息写入MySQL数据库"""
+        try:
+            self._upsert(self._weibo_sql, [self._to_row(w.to_tuple()) for w in weibos])
+            logger.info("%d条微博写入MySQL数据库完毕", len(weibos))
+        except self._pymysql.MySQLError as e:
+            # 抛给调用者，写入失败的微博不会被记为已爬取
+            logger.warning("写入MySQL数据库失败: %s", e)
+            raise
+
+    def write_user(self, user: User):
+        """将爬取的用户信息写入MySQL数据库"""
+        try:
+            self._upsert(self._user_sql, [user.to_tuple()])
+            logger.info("%s信息写入MySQL数据库完毕", user.nickname)
+        except self._pymysql.MySQLError as e:
+            # 抛给调用者，写入失败的微博不会被记为已爬取
+            logger.warning("写入MySQL数据库失败: %s", e)
+            raise
+
+    def close(self):
+        with self._pool_changed:
+            while self._idle:
+                self._idle.pop().close()
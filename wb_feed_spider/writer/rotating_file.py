@@ -0,0 +1,162 @@
+import gzip
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import partial
+
+logger = logging.getLogger("spider.rotating_file")
+
+DEFAULT_FILE_CONFIG = {
+    "buffer_size": 1024 * 1024,  # 每个写入块的大小(字节)，也是文件的写缓冲大小
+    "rotate_size": 100 * 1024 * 1024,  # 单个文件超过该大小后轮转，0表示不按大小轮转
+    "rotate_interval": 24 * 3600,  # 单个文件写入超过该秒数后轮转，0表示不按时间轮转
+    "compression": "",  # 空字符串、gzip或zstd
+    "fsync": "interval",  # always、interval或never
+    "fsync_interval": 5,  # fsync为interval时两次fsync的最小间隔(秒)
+    "index": 1,  # 是否写索引文件
+}
+
+COMPRESSION_SUFFIX = {"": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def _get_compressor(compression):
+    if not compression:
+        return None
+    if compression == "gzip":
+        return partial(gzip.compress, compresslevel=6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            logger.warning("系统中可能没有安装zstandard库，请先运行 pip install zstandard ，再运行程序")
+            sys.exit()
+        return zstandard.ZstdCompressor().compress
+    logger.warning("compression值应为空字符串、gzip或zstd")
+    sys.exit()
+
+
+class RotatingFile:
+    """按大小或时间轮转的只追加文件
+
+    文件名为 <prefix>.<创建时间><ext>[.gz|.zst]。每次append的记录拼成块整体写入，
+    压缩时每块是一个独立的gzip member/zstd frame，多个块直接拼接仍是合法的压缩文件。
+    开启索引时，每个数据文件旁有一个同名的.idx文件，每条记录一行：
+        未压缩:  <key>\t<记录在文件中的字节偏移>
+        压缩:    <key>\t<所在块在文件中的字节偏移>\t<记录在解压后的块中的字节偏移>
+    下游可以直接seek到记录(或记录所在的块)，不必从头扫描。
+    """
+
+    def __init__(self, prefix, ext, file_config=None, header=b""):
+        config = dict(DEFAULT_FILE_CONFIG, **(file_config or {}))
+        self.prefix = prefix
+        self.ext = ext + COMPRESSION_SUFFIX.get(config["compression"], "")
+        self.header = header  # 每个新文件开头写入的内容，如csv表头
+        self.buffer_size = config["buffer_size"]
+        self.rotate_size = config["rotate_size"]
+        self.rotate_interval = config["rotate_interval"]
+        self.fsync = config["fsync"]
+        self.fsync_interval = config["fsync_interval"]
+        self.index = config["index"]
+        self._compress = _get_compressor(config["compression"])
+        self.path = None
+        self._file = None
+        self._index_file = None
+        self._opened_at = 0.0
+        self._last_fsync = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _open(self):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = "%s.%s%s" % (self.prefix, stamp, self.ext)
+        n = 1
+        while os.path.exists(path):
+            path = "%s.%s-%d%s" % (self.prefix, stamp, n, self.ext)
+            n += 1
+        self.path = path
+        self._file = open(path, "ab", buffering=self.buffer_size)
+        if self.index:
+            self._index_file = open(path + ".idx", "a", encoding="utf-8")
+        self._opened_at = time.monotonic()
+        logger.info("开始写入%s", path)
+
+    def _close_files(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        if self._index_file:
+            self._index_file.flush()
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+            if self._index_file:
+                os.fsync(self._index_file.fileno())
+        self._file.close()
+        if self._index_file:
+            self._index_file.close()
+        self._file = self._index_file = None
+
+    def _should_rotate(self):
+        if self._file is None:
+            return True
+        if self.rotate_size and self._file.tell() >= self.rotate_size:
+            return True
+        if self.rotate_interval and time.monotonic() - self._opened_at >= self.rotate_interval:
+            return True
+        return False
+
+    def _write_block(self, lines, keys):
+        if self._should_rotate():
+            self._close_files()
+            self._open()
+            if self.header:
+                lines.insert(0, self.header)
+                keys.insert(0, None)
+        block_offset = self._file.tell()
+        data = b"".join(lines)
+        self._file.write(self._compress(data) if self._compress else data)
+
+        if self._index_file:
+            entries = []
+            offset = 0
+            for key, line in zip(keys, lines):
+                if key is not None:
+                    if self._compress:
+                        entries.append("%s\t%d\t%d\n" % (key, block_offset, offset))
+                    else:
+                        entries.append("%s\t%d\n" % (key, block_offset + offset))
+                offset += len(line)
+            self._index_file.write("".join(entries))
+
+    def _sync(self):
+        if self.fsync == "never":
+            return
+        now = time.monotonic()
+        if self.fsync == "always" or now - self._last_fsync >= self.fsync_interval:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if self._index_file:
+                self._index_file.flush()
+                os.fsync(self._index_file.fileno())
+            self._last_fsync = now
+
+    def append(self, records):
+        """records为 (key, 一行内容的bytes) 的序列，按buffer_size分块写入"""
+        with self._lock:
+            lines, keys, size = [], [], 0
+            for key, line in records:
+                lines.append(line)
+                keys.append(key)
+                size += len(line)
+                if size >= self.buffer_size:
+                    self._write_block(lines, keys)
+                    lines, keys, size = [], [], 0
+            if lines:
+                self._write_block(lines, keys)
+            if self._file is not None:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            self._close_files()
@@ -0,0 +1,152 @@
+import logging
+import sqlite3
+import threading
+
+from .writer import Writer
+from ..weibo import Weibo
+from ..user import User
+
+logger = logging.getLogger("spider.sqlite_writer")
+
+WEIBO_COLUMNS = {
+    "id": "TEXT PRIMARY KEY",
+    "user_id": "TEXT",
+    "content": "TEXT",
+    "article_url": "TEXT",
+    "original_pictures": "TEXT",
+    "retweet_pictures": "TEXT",
+    "original": "INTEGER",
+    "video_url": "TEXT",
+    "publish_place": "TEXT",
+    "publish_time": "TEXT",
+    "publish_tool": "TEXT",
+    "up_num": "INTEGER",
+    "retweet_num": "INTEGER",
+    "comment_num": "INTEGER",
+}
+USER_COLUMNS = dict(
+    {f: "TEXT" for f in User.FIELDS},
+    id="TEXT PRIMARY KEY",
+    weibo_num="INTEGER",
+    following="INTEGER",
+    followers="INTEGER",
+)
+
+
+# weibo_fts的同步触发器
+FTS_TRIGGERS = {
+    "weibo_fts_insert": """
+        CREATE TRIGGER weibo_fts_insert AFTER INSERT ON weibo BEGIN
+            INSERT INTO weibo_fts (rowid, content) VALUES (new.rowid, new.content);
+        END""",
+    "weibo_fts_delete": """
+        CREATE TRIGGER weibo_fts_delete AFTER DELETE ON weibo BEGIN
+            INSERT INTO weibo_fts (weibo_fts, rowid, content)
+            VALUES ('delete', old.rowid, old.content);
+        END""",
+    "weibo_fts_update": """
+        CREATE TRIGGER weibo_fts_update AFTER UPDATE OF content ON weibo BEGIN
+            INSERT INTO weibo_fts (weibo_fts, rowid, content)
+            VALUES ('delete', old.rowid, old.content);
+            INSERT INTO weibo_fts (rowid, content) VALUES (new.rowid, new.content);
+        END""",
+}
+
+
+def _upsert_sql(table, fields):
+    """INSERT ... ON CONFLICT(id) DO UPDATE，已存在的记录更新除id外的全部字段"""
+    return "INSERT INTO %s (%s) VALUES (%s) ON CONFLICT(id) DO UPDATE SET %s" % (
+        table,
+        ", ".join(fields),
+        ", ".join("?" * len(fields)),
+        ", ".join("%s = excluded.%s" % (f, f) for f in fields if f != "id"),
+    )
+
+
+class SqliteWriter(Writer):
+    """把微博和用户信息写入本地sqlite数据库
+
+    使用WAL模式，每批记录在一个事务中用同一条预编译的upsert语句executemany写入。
+    微博内容建有FTS5全文索引(weibo_fts)，sqlite不支持FTS5时跳过。
+    """
+
+    def __init__(self, sqlite_config):
+        self.path = sqlite_config or "weibo.db"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+        self._weibo_sql = _upsert_sql("weibo", Weibo.FIELDS)
+        self._user_sql = _upsert_sql("user", User.FIELDS)
+
+    def _create_tables(self):
+        with self._conn:
+            for table, columns in (("weibo", WEIBO_COLUMNS), ("user", USER_COLUMNS)):
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS %s (%s)"
+                    % (table, ", ".join("%s %s" % c for c in columns.items()))
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS weibo_user_id ON weibo (user_id)"
+            )
+        try:
+            self._create_fts()
+        except sqlite3.OperationalError as e:
+            logger.warning("sqlite不支持FTS5，不建立全文索引: %s", e)
+
+    def _create_fts(self):
+        """建立以weibo为外部内容表的FTS5索引，并用触发器保持同步
+
+        中文没有分词，优先使用trigram分词器以支持任意子串检索。
+        索引表与触发器在同一个事务中建立，不完整时(如旧版本中途失败)删除后重建。
+        """
+        names = {
+            row[0]
+            for row in self._conn.execute(
+                "SELECT name FROM sqlite_master WHERE name LIKE 'weibo_fts%'"
+            )
+        }
+        if {"weibo_fts", *FTS_TRIGGERS} <= names:
+            return
+        with self._conn:
+            self._conn.execute("BEGIN")
+            for trigger in FTS_TRIGGERS:
+                self._conn.execute("DROP TRIGGER IF EXISTS %s" % trigger)
+            self._conn.execute("DROP TABLE IF EXISTS weibo_fts")
+            try:
+                self._conn.execute(
+                    "CREATE VIRTUAL TABLE weibo_fts USING fts5(content, "
+                    "content='weibo', content_rowid='rowid', tokenize='trigram')"
+                )
+            except sqlite3.OperationalError:
+                self._conn.execute(
+                    "CREATE VIRTUAL TABLE weibo_fts USING fts5(content, "
+                    "content='weibo', content_rowid='rowid')"
+                )
+            for sql in FTS_TRIGGERS.values():
+                self._conn.execute(sql)
+            self._conn.execute("INSERT INTO weibo_fts (weibo_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def _to_row(values):
+        # 图片url的tuple以逗号连接保存
+        return tuple(",".join(v) if isinstance(v, tuple) else v for v in values)
+
+    def _upsert(self, sql, rows):
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    def write_weibo(self, weibos: list[Weibo]):
+        """将爬取的微博信息写入sqlite数据库"""
+        self._upsert(self._weibo_sql, [self._to_row(w.to_tuple()) for w in weibos])
+        logger.info("%d条微博写入sqlite数据库完毕", len(weibos))
+
+    def write_user(self, user: User):
+        """将爬取的用户信息写入sqlite数据库"""
+        self._upsert(self._user_sql, [user.to_tuple()])
+        logger.info("%s信息写入sqlite数据库完毕", user.nickname)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
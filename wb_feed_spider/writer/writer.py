@@ -15,3 +15,7 @@ class Writer(ABC):
     def write_user(self, user):
         """给定用户信息，写入对应文本或数据库"""
         pass
+
+    def close(self):
+        """刷新缓冲、释放文件或数据库连接"""
+        pass